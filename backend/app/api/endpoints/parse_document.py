@@ -1,59 +1,243 @@
 from fastapi import FastAPI, UploadFile, File, APIRouter, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from deepface import DeepFace
 import cv2
 import numpy as np
 import os
 from pathlib import Path
 from typing import Dict
+import threading
 import time
-from app.services.anti_spoof import detect_head_pose
+import uuid
+from app.services.audit_log import AuditLog
+from app.services.anti_spoof import AntiSpoof, DECISION_LIVE, HeadPoseEngine, PASSIVE_SKIP_DISABLED
+from app.services.face_recognition import FaceRecognitionService, ARCFACE_COSINE_THRESHOLD
+from app.services.model_client import RemoteFaceRecognitionService
+from app.services.embedding_index import EmbeddingIndex
+from app.services.embedding_store import EmbeddingStore, KEY_BYTES, apply_changes
+from app.services.qos import QoSController, DETECTOR_BACKENDS, TIER_CACHED, TIER_FULL
+from app.services.frame_coalescer import FrameCoalescer, FrameSuperseded
+from app.services.verification_jobs import VerificationJobQueue, JOB_SUBMITTED, JOB_BUSY
+from app.services.capture_hints import (
+    CaptureHintAdvisor, STATE_NO_FACE, STATE_TRACKING, STATE_TRANSITION, STATE_COMPLETE
+)
 router = APIRouter()
 id_path = None
+id_embedding = None
+# Applicant the current ID belongs to; session references must belong to them too
+id_applicant_id = None
+# Uploaded ID awaiting enrollment: (applicant_id, embedding, face crop). It is
+# only written to the store and index once a session passes liveness against it
+pending_applicant = None
+# Blink verification completes on a job thread, head turns on the event loop
+enrollment_lock = threading.Lock()
 from app.services.blink_detection import FaceBlinkDetector
+from app.services.upload_reader import read_upload, read_image, decode_image
 TEMP_DIR = Path("temp_uploads")
 TEMP_DIR.mkdir(exist_ok=True)
 
 # Session storage for liveness verification
 liveness_sessions: Dict[str, dict] = {}
 detector = FaceBlinkDetector()  
+# With FACE_MODEL_SOCKET set, DeepFace runs in app.model_server and this
+# process only ever loads OpenCV
+MODEL_SOCKET = os.getenv("FACE_MODEL_SOCKET")
+face_service = (
+    RemoteFaceRecognitionService(MODEL_SOCKET, frame_slots=int(os.getenv("FRAME_POOL_SLOTS", 8)))
+    if MODEL_SOCKET else FaceRecognitionService()
+)
+qos = QoSController()
+frame_coalescer = FrameCoalescer()
+hint_advisor = CaptureHintAdvisor(qos)
+verification_jobs = VerificationJobQueue(max_workers=int(os.getenv("VERIFICATION_WORKERS", 2)))
+# Sessions scoring at least PASSIVE_LIVE_THRESHOLD skip the head turns. The
+# score is always recorded, but skipping stays off (above 1.0) until the ramps
+# have been calibrated on the deployment's own captures
+anti_spoof = AntiSpoof(live_threshold=float(os.getenv("PASSIVE_LIVE_THRESHOLD", PASSIVE_SKIP_DISABLED)))
+# Frontal and both profile scans of a head-turn frame run in parallel
+head_pose_engine = HeadPoseEngine(threads=int(os.getenv("HEAD_POSE_THREADS", 0)))
+# Durable record of every verification decision (AUDIT_LOG_BACKEND: sqlite or jsonl)
+audit_log = AuditLog(
+    os.getenv("AUDIT_LOG_PATH", "audit/audit.db"),
+    backend=os.getenv("AUDIT_LOG_BACKEND", "sqlite"),
+    max_queue=int(os.getenv("AUDIT_LOG_MAX_QUEUE", 10000)),
+)
+
+# Persistent ID embeddings and face crops, shared by all workers through the page cache
+applicant_store = EmbeddingStore(os.getenv("EMBEDDING_STORE_DIR", "embedding_store"))
+applicant_store.compact_if_needed()
+# 1:N index of every accepted applicant's ID embedding, for duplicate checks
+applicant_index = EmbeddingIndex.from_matrix(
+    *applicant_store.live(), nlist=int(os.getenv("APPLICANT_INDEX_NLIST", 0))
+)
+ID_CROP_SIZE = applicant_store.crop_size
+DUPLICATE_SIMILARITY = 1.0 - ARCFACE_COSINE_THRESHOLD
+# Extra references (other stored IDs of the applicant) a session may hold
+MAX_SESSION_REFERENCES = int(os.getenv("MAX_SESSION_REFERENCES", 8))
 class LivenessResetRequest(BaseModel):
     session_id: str
 
 
 
-def verify_against_id(live_image_path: str) -> tuple:
+def verify_against_id(live_image, session: dict = None, profile: bool = False) -> tuple:
     """
-    Verify if the person in the live image matches the ID.
-    Returns: (is_match, distance, threshold, error_message)
+    Verify if the person in the live image (path or BGR array) matches the ID.
+    The detector tier is chosen by the QoS controller from the current load,
+    except for profile frames (head turns): the OpenCV detector and the
+    frontal Haar crop of the degraded tiers miss turned faces, so those
+    always run at the full tier with MTCNN.
+    If the session holds extra references and the ID embedding is known, the
+    face is checked against the ID and all of them at once (see
+    verify_against_references).
+    Returns: (is_match, distance, threshold, error_message, tier, references)
+    references is None unless several references were compared.
     """
-    global id_path
+    if not id_available():
+        return False, None, None, "ID not uploaded", None, None
     
-    if id_path is None or not os.path.exists(id_path):
-        return False, None, None, "ID not uploaded"
+    if (
+        session is not None and session["reference_labels"] and id_embedding is not None
+        and session["reference_owner"] == id_applicant_id
+    ):
+        return verify_against_references(live_image, session, profile)
     
-    try:
-        result = DeepFace.verify(
-            img1_path=id_path,
-            img2_path=live_image_path,
-            model_name="ArcFace",
-            enforce_detection=True,
-            detector_backend="mtcnn"
+    id_file = id_path is not None and os.path.exists(id_path)
+    if profile:
+        tier = TIER_FULL
+    elif id_file:
+        tier = qos.select_tier(cached_available=id_embedding is not None)
+    else:
+        # ID loaded from the embedding store: only the embedding is available
+        tier = TIER_CACHED
+    started = time.time()
+    
+    if tier == TIER_CACHED:
+        verified, distance, threshold, error = face_service.verify_with_embedding(live_image, id_embedding)
+    elif not id_file:
+        # Embedding-only ID, but the live face still goes through the tier's detector
+        verified, distance, threshold, error = face_service.verify_with_embedding(
+            live_image, id_embedding, detector_backend=DETECTOR_BACKENDS[tier]
         )
-        
-        verified = result["verified"]
-        distance = result["distance"]
-        threshold = result["threshold"]
-        
-        print(f"  🔍 ID Verification: {'✅ MATCH' if verified else '❌ NO MATCH'} - Distance: {distance:.4f}, Threshold: {threshold:.4f}")
-        
-        return verified, distance, threshold, None
-        
-    except Exception as e:
-        error_msg = str(e).lower()
-        print(f"  ❌ ID Verification Error: {str(e)}")
-        return False, None, None, str(e)
+    else:
+        verified, distance, threshold, error = face_service.verify_against_id(
+            live_image, id_path, detector_backend=DETECTOR_BACKENDS[tier]
+        )
+    
+    qos.record(tier, time.time() - started)
+    print(f"  ⚙️ QoS tier: {tier}")
+    
+    return verified, distance, threshold, error, tier, None
+
+
+def verify_against_references(live_image, session: dict, profile: bool = False) -> tuple:
+    """
+    Compare the live face with the ID embedding and every session reference
+    in one matrix operation, so each extra reference costs a dot product,
+    not another model pass. The ID distance alone decides the match (and is
+    the reported distance); the other references only corroborate it.
+    Returns: (is_match, distance, threshold, error_message, tier, references)
+    """
+    labels = ["id"] + session["reference_labels"]
+    matrix = np.vstack([id_embedding[None, :], session["reference_embeddings"]])
+    
+    # Every reference is already an embedding, so the cached tier is always
+    # available; profile frames need MTCNN (see verify_against_id)
+    tier = TIER_FULL if profile else qos.select_tier(cached_available=True)
+    detector_backend = "skip" if tier == TIER_CACHED else DETECTOR_BACKENDS[tier]
+    started = time.time()
+    
+    verified, distances, threshold, error = face_service.verify_with_references(live_image, matrix, detector_backend)
+    
+    qos.record(tier, time.time() - started)
+    print(f"  ⚙️ QoS tier: {tier}")
+    
+    if distances is None:
+        return False, None, threshold, error, tier, None
+    
+    references = [
+        {"label": label, "distance": round(float(distance), 4), "matched": bool(distance <= threshold)}
+        for label, distance in zip(labels, distances)
+    ]
+    return verified, float(distances[0]), threshold, error, tier, references
+
+
+def audit_verification(session_id: str, stage: str, verified: bool, distance, threshold, error: str, tier: str, references: list = None):
+    audit_log.record(
+        "id_verification", session_id,
+        stage=stage,
+        verified=bool(verified),
+        distance=float(distance) if distance is not None else None,
+        threshold=float(threshold) if threshold is not None else None,
+        detector_tier=tier,
+        error=error,
+        references=references,
+    )
+
+
+def id_available() -> bool:
+    return id_embedding is not None or (id_path is not None and os.path.exists(id_path))
+
+
+def applicant_of(key: str) -> str:
+    """Owner of a store record: an applicant's own ID, or "<applicant_id>:<label>" for their secondary IDs."""
+    return key.split(":", 1)[0]
+
+
+def sync_applicants(write=None):
+    """
+    Run a store write (or just a refresh) and apply the changes it returns -
+    ours and other workers', incl. deletes and compactions - to the index.
+    Both happen under the store's lock, so the blink job thread and the event
+    loop apply changes to the index in the order they were made.
+    """
+    with applicant_store.lock:
+        changes = write() if write is not None else applicant_store.refresh()
+        apply_changes(applicant_index, applicant_store, changes)
+
+
+def find_duplicate_applicants(embedding: np.ndarray, k: int = 5) -> list:
+    """Applicants in the index whose face matches this embedding, most similar first."""
+    sync_applicants()
+    matches = applicant_index.search(embedding, k=k)[0]
+    duplicates = {}
+    for match_id, similarity in matches:
+        # Secondary IDs count towards their applicant
+        owner = applicant_of(match_id)
+        if similarity >= DUPLICATE_SIMILARITY and owner not in duplicates:
+            duplicates[owner] = {"applicant_id": owner, "similarity": round(similarity, 4)}
+    return list(duplicates.values())
+
+
+def enroll_if_accepted(session_id: str, session: dict):
+    """
+    Persist and index the uploaded ID once a session has completed liveness
+    against it, so rejected attempts and retried uploads never reach the
+    store or the duplicate index.
+    """
+    global pending_applicant
+    
+    if not (session["blink_detected"] and session["left_pose_detected"] and session["right_pose_detected"]):
+        return
+    with enrollment_lock:
+        applicant, pending_applicant = pending_applicant, None
+    if applicant is None:
+        return
+    
+    applicant_id, embedding, crop = applicant
+    sync_applicants(lambda: applicant_store.put(applicant_id, embedding, crop))
+    session["applicant_id"] = applicant_id
+    audit_log.record("applicant_enrolled", session_id, applicant_id=applicant_id)
+    print(f"🗂️ Applicant {applicant_id} enrolled")
+
+
+def face_crop(image: np.ndarray, box: tuple):
+    """Square-resized face crop for the embedding store, or None if the box is empty."""
+    x, y, w, h = [int(v) for v in box]
+    crop = image[max(y, 0):y + h, max(x, 0):x + w]
+    if crop.size == 0:
+        return None
+    return cv2.resize(crop, (ID_CROP_SIZE, ID_CROP_SIZE), interpolation=cv2.INTER_AREA)
 
 
 def get_or_create_session(session_id: str) -> dict:
@@ -64,6 +248,12 @@ def get_or_create_session(session_id: str) -> dict:
             "blink_detected": False,
             "left_pose_detected": False,
             "right_pose_detected": False,
+            "left_pose_skipped": False,
+            "right_pose_skipped": False,
+            "passive_liveness": None,
+            "reference_labels": [],
+            "reference_embeddings": None,
+            "reference_owner": None,
             "previous_blink_state": "unknown",
             "previous_left_state": "frontal",
             "previous_right_state": "frontal",
@@ -74,14 +264,26 @@ def get_or_create_session(session_id: str) -> dict:
             "created_at": time.time(),
             "frame_count": 0,
             "left_frontal_rejected_count": 0,
-            "right_frontal_rejected_count": 0
+            "right_frontal_rejected_count": 0,
+            "frame_size": None,
+            "last_face_box": None,
+            "applicant_id": None,
+            "verification": None
         }
     return liveness_sessions[session_id]
 
 
 @router.post("/upload-id")
 async def upload_id(file: UploadFile = File(...)):
-    global id_path
+    """
+    Upload the applicant's ID photo. The face embedding is searched against
+    every previously accepted applicant to flag one face applying under
+    several IDs. It is persisted to the embedding store and added to the
+    index only after a session passes liveness against it (enroll_if_accepted).
+    The applicant id is always generated here: a client-chosen id could hide
+    another applicant from the duplicate check and overwrite their record.
+    """
+    global id_path, id_embedding, id_applicant_id, pending_applicant
     
     try:
         if not file.content_type.startswith('image/'):
@@ -90,32 +292,50 @@ async def upload_id(file: UploadFile = File(...)):
                 "message": "Invalid file type. Please upload an image."
             }
         
+        content, _, dimensions = await read_upload(file)
+        id_image = decode_image(content, dimensions)
         id_path = str(TEMP_DIR / "temp_id.jpg")
         
-        with open(id_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
+        # Store the size-capped decode so later verifications never reload the original
+        cv2.imwrite(id_path, id_image)
         
         print(f"✅ ID image saved to {id_path}")
         
         try:
-            DeepFace.extract_faces(id_path, enforce_detection=True)
+            # Embedding doubles as the face check and feeds the cached QoS tier
+            # MTCNN + ArcFace (or a model server round trip); keep it off the event loop
+            id_embedding, face_box = await run_in_threadpool(face_service.represent_face, id_image, "mtcnn")
             print("✅ Face detected in ID image")
-            
-            return {
-                "status": "success",
-                "message": "ID uploaded successfully. Face detected!"
-            }
         except Exception as face_error:
             if os.path.exists(id_path):
                 os.remove(id_path)
             id_path = None
+            id_embedding = None
+            id_applicant_id = None
+            pending_applicant = None
             
             print(f"❌ No face detected in ID: {str(face_error)}")
             return {
                 "status": "error",
                 "message": "No face detected in ID photo. Please upload a clear photo with your face."
             }
+        
+        applicant_id = str(uuid.uuid4())
+        duplicates = await run_in_threadpool(find_duplicate_applicants, id_embedding)
+        pending_applicant = (applicant_id, id_embedding, face_crop(id_image, face_box))
+        id_applicant_id = applicant_id
+        
+        if duplicates:
+            print(f"⚠️ Possible duplicate applicant {applicant_id}: {duplicates}")
+        
+        return {
+            "status": "success",
+            "message": "ID uploaded successfully. Face detected!",
+            "applicant_id": applicant_id,
+            "enrolled": False,
+            "possible_duplicate": bool(duplicates),
+            "duplicate_candidates": duplicates
+        }
             
     except Exception as e:
         print(f"❌ Error uploading ID: {str(e)}")
@@ -125,17 +345,314 @@ async def upload_id(file: UploadFile = File(...)):
         }
 
 
+@router.post("/load-id/{applicant_id}")
+async def load_id(applicant_id: str):
+    """
+    Use a stored applicant's ID embedding for verification, without
+    re-uploading the photo or re-running detection and embedding.
+    """
+    global id_path, id_embedding, id_applicant_id, pending_applicant
+    
+    sync_applicants()
+    embedding = applicant_store.get(applicant_id)
+    if embedding is None:
+        return {
+            "status": "error",
+            "message": f"Applicant {applicant_id} not found"
+        }
+    
+    id_embedding = np.array(embedding)
+    id_path = None
+    id_applicant_id = applicant_of(applicant_id)
+    pending_applicant = None
+    print(f"✅ ID embedding for {applicant_id} loaded from store")
+    
+    return {
+        "status": "success",
+        "message": "ID loaded from store",
+        "applicant_id": applicant_id,
+        "has_face_crop": applicant_store.get_crop(applicant_id) is not None
+    }
+
+
+@router.post("/add-secondary-id")
+async def add_secondary_id(file: UploadFile = File(...), label: str = None):
+    """
+    Store another ID photo (e.g. a secondary ID) of the current, already
+    enrolled applicant as "<applicant_id>:<label>", for use as a session
+    reference (see /add-reference).
+    """
+    if id_applicant_id is None or id_applicant_id not in applicant_store:
+        return {
+            "status": "error",
+            "message": "Secondary IDs can only be added for an enrolled applicant"
+        }
+    
+    key = f"{id_applicant_id}:{label or uuid.uuid4().hex[:8]}"
+    if len(key.encode()) > KEY_BYTES or ":" in (label or ""):
+        return {
+            "status": "error",
+            "message": "Label too long or contains ':'"
+        }
+    
+    try:
+        if not file.content_type.startswith('image/'):
+            return {
+                "status": "error",
+                "message": "Invalid file type. Please upload an image."
+            }
+        
+        content, _, dimensions = await read_upload(file)
+        image = decode_image(content, dimensions)
+        embedding, face_box = await run_in_threadpool(face_service.represent_face, image, "mtcnn")
+        crop = face_crop(image, face_box)
+        await run_in_threadpool(sync_applicants, lambda: applicant_store.put(key, embedding, crop))
+        print(f"✅ Secondary ID {key} stored")
+        
+        return {
+            "status": "success",
+            "message": "Secondary ID stored",
+            "reference_id": key
+        }
+        
+    except Exception as e:
+        print(f"❌ Error storing secondary ID: {str(e)}")
+        return {
+            "status": "error",
+            "message": f"Failed to store secondary ID: {str(e)}"
+        }
+
+
+@router.post("/add-reference")
+async def add_reference(reference_id: str, session_id: str = "default", label: str = None):
+    """
+    Add one of the current applicant's stored ID embeddings (their own ID or
+    a secondary ID from /add-secondary-id) to a session as a reference.
+    Later verifications in the session compare the live face with the ID and
+    all references in one pass. References only corroborate the ID match.
+    Records of other applicants are refused: their per-reference distances
+    would let a client test its face against anyone's stored ID.
+    """
+    if id_applicant_id is None or applicant_of(reference_id) != id_applicant_id:
+        return {
+            "status": "error",
+            "message": "Reference does not belong to the current applicant"
+        }
+    
+    session = get_or_create_session(session_id)
+    if session["reference_owner"] != id_applicant_id:
+        # References collected for a previous ID
+        session["reference_labels"] = []
+        session["reference_embeddings"] = None
+        session["reference_owner"] = id_applicant_id
+    if len(session["reference_labels"]) >= MAX_SESSION_REFERENCES:
+        return {
+            "status": "error",
+            "message": f"A session can hold at most {MAX_SESSION_REFERENCES} references"
+        }
+    
+    try:
+        sync_applicants()
+        embedding = applicant_store.get(reference_id)
+        if embedding is None:
+            return {
+                "status": "error",
+                "message": f"Reference {reference_id} not found"
+            }
+        embedding = np.array(embedding)
+        
+        label = label or reference_id
+        matrix = session["reference_embeddings"]
+        session["reference_embeddings"] = embedding[None, :] if matrix is None else np.vstack([matrix, embedding[None, :]])
+        session["reference_labels"].append(label)
+        print(f"✅ Reference '{label}' added to session {session_id} ({len(session['reference_labels'])} total)")
+        
+        return {
+            "status": "success",
+            "message": "Reference added",
+            "session_id": session_id,
+            "label": label,
+            "references": session["reference_labels"]
+        }
+        
+    except Exception as e:
+        print(f"❌ Error adding reference: {str(e)}")
+        return {
+            "status": "error",
+            "message": f"Failed to add reference: {str(e)}"
+        }
+
+
+@router.post("/search-duplicates")
+async def search_duplicates(file: UploadFile = File(...), k: int = 5):
+    """Find accepted applicants whose face matches the uploaded photo."""
+    try:
+        image = await read_image(file)
+        embedding = await run_in_threadpool(face_service.represent, image, "mtcnn")
+        
+        await run_in_threadpool(sync_applicants)
+        matches = applicant_index.search(embedding, k=k)[0]
+        candidates = [
+            {
+                "applicant_id": match_id,
+                "similarity": round(similarity, 4),
+                "is_duplicate": similarity >= DUPLICATE_SIMILARITY
+            }
+            for match_id, similarity in matches
+        ]
+        
+        return {
+            "status": "success",
+            "indexed_applicants": len(applicant_index),
+            "possible_duplicate": any(c["is_duplicate"] for c in candidates),
+            "candidates": candidates
+        }
+    except ValueError as ve:
+        print(f"⚠️ Duplicate search error: {str(ve)}")
+        return {
+            "status": "error",
+            "message": "No face detected. Please upload a clear photo with your face."
+        }
+    except Exception as e:
+        print(f"❌ Error searching duplicates: {str(e)}")
+        return {
+            "status": "error",
+            "message": str(e)
+        }
+
+
+def run_blink_verification(session_id: str, session: dict, live_image):
+    """Background job: verify the blink frame against the ID and store the outcome in the session."""
+    verified, distance, threshold, error_msg, tier, references = verify_against_id(live_image, session)
+    audit_verification(session_id, "blink", verified, distance, threshold, error_msg, tier, references)
+    
+    session["verification"] = {
+        "status": "verified" if verified else "failed",
+        "distance": float(distance) if distance is not None else None,
+        "threshold": float(threshold) if threshold is not None else None,
+        "detector_tier": tier,
+        "references": references,
+        "error": error_msg,
+        "completed_at": time.time()
+    }
+    
+    if verified:
+        session["blink_detected"] = True
+        print(f"✅ ✅ ✅ ID VERIFIED during blink! Person matches ID photo! ✅ ✅ ✅")
+        enroll_if_accepted(session_id, session)
+    else:
+        print(f"❌ Blink ID verification failed: {error_msg if error_msg else 'No match'}")
+
+
+def score_passive_liveness(session_id: str, session: dict, live_image, geometry: dict, crop_box: tuple = None):
+    """
+    Score the session's first good frontal frame once. A confident live score
+    marks both head turns as done, so the applicant only has to blink; the
+    blink is still verified against the ID before liveness is complete.
+    """
+    # For crop uploads the face fills the image, so detect it again in there
+    face_box = geometry.get("face_box") if crop_box is None else None
+    result = anti_spoof.score(live_image, face_box)
+    if result is None:
+        return
+    
+    session["passive_liveness"] = result
+    audit_log.record("passive_liveness", session_id, score=result["score"], decision=result["decision"], cues=result["cues"])
+    if result["decision"] == DECISION_LIVE:
+        for direction in ("left", "right"):
+            if not session[f"{direction}_pose_detected"]:
+                session[f"{direction}_pose_detected"] = True
+                session[f"{direction}_pose_skipped"] = True
+        print(f"🛡️ Passive liveness confident - head turns skipped")
+
+
+def head_turns_skipped(session: dict) -> bool:
+    return session["left_pose_skipped"] and session["right_pose_skipped"]
+
+
+def track_face(session: dict, geometry: dict):
+    """Remember the latest face geometry so hints survive frames without a face."""
+    if "frame_size" in geometry:
+        session["frame_size"] = geometry["frame_size"]
+    if "face_box" in geometry:
+        session["last_face_box"] = geometry["face_box"]
+
+
+def capture_hints_for(session: dict, challenge_state: str) -> dict:
+    return hint_advisor.hints(challenge_state, session["frame_size"], session["last_face_box"])
+
+
+def superseded_response(session_id: str) -> dict:
+    """Answer for a frame that was dropped because a newer one is queued."""
+    print(f"⏭️ Stale frame superseded - Session: {session_id}")
+    return {
+        "status": "superseded",
+        "superseded": True,
+        "face_detected": False,
+        "session_id": session_id,
+        "message": "Superseded by a newer frame"
+    }
+
+
 @router.post("/detect-blink")
 async def detect_blink(file: UploadFile = File(...), session_id: str = "default"):
     """
     Detect single blink for liveness verification.
+    Only the newest queued frame per session is processed; older ones are
+    answered with a "superseded" status without running the detectors.
+    The ID check for a blink runs in the background: the response reports
+    verification_pending and /session-status/{session_id} the outcome.
     """
-    live_path = str(TEMP_DIR / f"temp_blink_{session_id}.jpg")
+    try:
+        async with frame_coalescer.slot((session_id, "blink")):
+            return await process_blink_frame(file, session_id)
+    except FrameSuperseded:
+        return superseded_response(session_id)
+
+
+@router.post("/detect-blink-roi")
+async def detect_blink_roi(
+    file: UploadFile = File(...),
+    session_id: str = "default",
+    crop_x: int = 0,
+    crop_y: int = 0,
+    crop_width: int = 0,
+    crop_height: int = 0,
+    frame_width: int = 0,
+    frame_height: int = 0
+):
+    """
+    Same as /detect-blink, but the upload is a face crop (the crop_region
+    from capture_hints) with its bounding box and the original frame size,
+    all in pixels. Face detection is skipped: the crop goes straight into
+    eye analysis.
+    """
+    crop_box, frame_size, error = parse_roi(crop_x, crop_y, crop_width, crop_height, frame_width, frame_height)
+    if error:
+        return {"face_detected": False, "eyes_open": True, "blink_detected": False, "error": error}
     
     try:
-        with open(live_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
+        async with frame_coalescer.slot((session_id, "blink")):
+            return await process_blink_frame(file, session_id, crop_box, frame_size)
+    except FrameSuperseded:
+        return superseded_response(session_id)
+
+
+def parse_roi(crop_x: int, crop_y: int, crop_width: int, crop_height: int, frame_width: int, frame_height: int) -> tuple:
+    """
+    Validate a face-crop bounding box against the original frame.
+    Returns: (crop_box, frame_size, error_message)
+    """
+    if crop_width <= 0 or crop_height <= 0 or frame_width <= 0 or frame_height <= 0:
+        return None, None, "crop_width, crop_height, frame_width and frame_height must be positive"
+    if crop_x < 0 or crop_y < 0 or crop_x + crop_width > frame_width or crop_y + crop_height > frame_height:
+        return None, None, "Crop box lies outside the frame"
+    return (crop_x, crop_y, crop_width, crop_height), (frame_width, frame_height), None
+
+
+async def process_blink_frame(file: UploadFile, session_id: str, crop_box: tuple = None, frame_size: tuple = None) -> dict:
+    try:
+        live_image = await read_image(file)
         
         session = get_or_create_session(session_id)
         session["frame_count"] += 1
@@ -143,7 +660,16 @@ async def detect_blink(file: UploadFile = File(...), session_id: str = "default"
         print(f"\n{'='*60}")
         print(f"📸 BLINK CHECK - Frame #{session['frame_count']} - Session: {session_id}")
         
-        face_detected, eyes_open, left_ear, right_ear, num_eyes = FaceBlinkDetector.detect_blink(live_path)
+        geometry = {}
+        # Detectors run off the event loop so newer frames can queue up and supersede this one
+        face_detected, eyes_open, left_ear, right_ear, num_eyes = await run_in_threadpool(
+            detector.detect_blink, live_image, geometry, crop_box, frame_size
+        )
+        track_face(session, geometry)
+        
+        # Both eyes open on a detected face is a good frontal frame
+        if session["passive_liveness"] is None and face_detected and eyes_open and num_eyes >= 2:
+            await run_in_threadpool(score_passive_liveness, session_id, session, live_image, geometry, crop_box)
         
         current_time = time.time()
         current_state = "open" if eyes_open else "closed"
@@ -162,30 +688,22 @@ async def detect_blink(file: UploadFile = File(...), session_id: str = "default"
                 print(f"⏱️ Eyes closed duration: {time_closed:.2f}s")
                 
                 if time_closed >= 0.05 and time_since_last >= 0.2:
-                  
-                    try:
-                        result = DeepFace.verify(
-                            img1_path=id_path,
-                            img2_path=live_path,
-                            model_name="ArcFace",  
-                            detector_backend="mtcnn",
-                            enforce_detection=True)
-                        
-                        
-                        verified = result["verified"]
-                        
-                        distance = result["distance"]
-                        threshold = result["threshold"]
-                        
-                        if verified:
-                            session["blink_detected"] = True
-                            print(f"✅ ✅ ✅ ID VERIFIED during blink! Person matches ID photo! ✅ ✅ ✅")
-                        
-                    except Exception as e:
-                        print(f"  ❌ Error updating session: {str(e)}")
+                    # Verify in the background so this frame returns right away. Mark the
+                    # session pending first: a job that fails fast may finish before submit() returns
+                    previous_verification = session["verification"]
+                    pending = {"status": "pending", "submitted_at": current_time}
+                    session["verification"] = pending
+                    job_status = verification_jobs.submit(session_id, run_blink_verification, session_id, session, live_image)
+                    
+                    if job_status == JOB_SUBMITTED:
+                        print(f"🔍 ID verification queued")
+                    else:
+                        # Not queued; keep a result an already running job may have stored meanwhile
+                        if session["verification"] is pending:
+                            session["verification"] = previous_verification
+                        if job_status == JOB_BUSY:
+                            print(f"⚠️ Verification queue full, will retry on the next blink")
                     
-                      
-                        
                     session["last_blink_time"] = current_time
                     blink_completed = True
                     print(f"✅ ✅ ✅ BLINK DETECTED! ✅ ✅ ✅")
@@ -201,10 +719,18 @@ async def detect_blink(file: UploadFile = File(...), session_id: str = "default"
         print(f"📈 Blink Status: {'✅ Complete' if session['blink_detected'] else '⏳ Waiting'}")
         print(f"{'='*60}\n")
         
-        if os.path.exists(live_path):
-            os.remove(live_path)
-        
         avg_ear = (left_ear + right_ear) / 2.0 if left_ear > 0 or right_ear > 0 else 0.0
+        verification = session["verification"]
+        verification_pending = verification is not None and verification["status"] == "pending"
+        
+        if session["blink_detected"]:
+            challenge_state = STATE_COMPLETE
+        elif not face_detected:
+            challenge_state = STATE_NO_FACE
+        elif current_state == "closed":
+            challenge_state = STATE_TRANSITION
+        else:
+            challenge_state = STATE_TRACKING
         
         return {
             "face_detected": bool(face_detected),
@@ -214,7 +740,13 @@ async def detect_blink(file: UploadFile = File(...), session_id: str = "default"
             "session_id": session_id,
             "current_state": current_state,
             "num_eyes_detected": num_eyes,
-            "message": "Blink detected!" if session["blink_detected"] else "Waiting for blink..."
+            "verification_pending": verification_pending,
+            "verification": verification,
+            "detector_tier": verification.get("detector_tier") if verification else None,
+            "passive_liveness": session["passive_liveness"],
+            "head_turns_skipped": head_turns_skipped(session),
+            "capture_hints": capture_hints_for(session, challenge_state),
+            "message": "Blink detected!" if session["blink_detected"] else ("Verifying ID..." if verification_pending else "Waiting for blink...")
         }
         
     except Exception as e:
@@ -222,9 +754,6 @@ async def detect_blink(file: UploadFile = File(...), session_id: str = "default"
         import traceback
         traceback.print_exc()
         
-        if os.path.exists(live_path):
-            os.remove(live_path)
-        
         return {
             "face_detected": False,
             "eyes_open": True,
@@ -240,13 +769,46 @@ async def detect_head_turn(file: UploadFile = File(...), session_id: str = "defa
     Direction should be 'left' or 'right'.
     IMPORTANT: User must actually turn their head - frontal face will be rejected.
     After successful turn detection, verifies against ID photo.
+    Only the newest queued frame per session and direction is processed.
     """
-    live_path = str(TEMP_DIR / f"temp_pose_{session_id}_{direction}.jpg")
+    try:
+        async with frame_coalescer.slot((session_id, f"head_turn_{direction}")):
+            return await process_head_turn_frame(file, session_id, direction)
+    except FrameSuperseded:
+        return superseded_response(session_id)
+
+
+@router.post("/detect-head-turn-roi")
+async def detect_head_turn_roi(
+    file: UploadFile = File(...),
+    session_id: str = "default",
+    direction: str = "left",
+    crop_x: int = 0,
+    crop_y: int = 0,
+    crop_width: int = 0,
+    crop_height: int = 0,
+    frame_width: int = 0,
+    frame_height: int = 0
+):
+    """
+    Same as /detect-head-turn, but the upload is a face crop with its bounding
+    box and the original frame size, all in pixels. The head shift is still
+    measured against the full frame.
+    """
+    crop_box, frame_size, error = parse_roi(crop_x, crop_y, crop_width, crop_height, frame_width, frame_height)
+    if error:
+        return {"face_detected": False, "is_profile": False, "is_frontal": False, "pose_detected": False, "id_verified": False, "error": error}
     
     try:
-        with open(live_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
+        async with frame_coalescer.slot((session_id, f"head_turn_{direction}")):
+            return await process_head_turn_frame(file, session_id, direction, crop_box, frame_size)
+    except FrameSuperseded:
+        return superseded_response(session_id)
+
+
+async def process_head_turn_frame(file: UploadFile, session_id: str, direction: str, crop_box: tuple = None, frame_size: tuple = None) -> dict:
+    try:
+        live_image = await read_image(file)
         
         session = get_or_create_session(session_id)
         session["frame_count"] += 1
@@ -254,13 +816,20 @@ async def detect_head_turn(file: UploadFile = File(...), session_id: str = "defa
         print(f"\n{'='*60}")
         print(f"📸 HEAD TURN CHECK ({direction.upper()}) - Frame #{session['frame_count']} - Session: {session_id}")
         
-        face_detected, is_profile, face_area, eye_count, is_frontal = detect_head_pose(live_path)
+        geometry = {}
+        # Detectors run off the event loop so newer frames can queue up and supersede this one
+        face_detected, is_profile, face_area, eye_count, is_frontal = await run_in_threadpool(
+            head_pose_engine.detect, live_image, geometry, crop_box, frame_size
+        )
+        track_face(session, geometry)
         
         current_time = time.time()
         pose_completed = False
         id_verified = False
         id_distance = None
         id_threshold = None
+        verification_tier = None
+        id_references = None
         rejection_reason = None
         
         if face_detected:
@@ -292,7 +861,10 @@ async def detect_head_turn(file: UploadFile = File(...), session_id: str = "defa
                     print(f"🔍 Now verifying against ID photo...")
                     
                     # Verify against ID photo
-                    is_match, distance, threshold, error_msg = verify_against_id(live_path)
+                    is_match, distance, threshold, error_msg, verification_tier, id_references = await run_in_threadpool(
+                        verify_against_id, live_image, session, True
+                    )
+                    audit_verification(session_id, f"head_turn_{direction}", is_match, distance, threshold, error_msg, verification_tier, id_references)
                     
                     if is_match:
                         session[detected_key] = True
@@ -302,6 +874,7 @@ async def detect_head_turn(file: UploadFile = File(...), session_id: str = "defa
                         id_distance = distance
                         id_threshold = threshold
                         print(f"✅ ✅ ✅ ID VERIFIED! Person matches ID photo! ✅ ✅ ✅")
+                        enroll_if_accepted(session_id, session)
                     else:
                         rejection_reason = "Person does not match ID photo"
                         print(f"❌ ID VERIFICATION FAILED: {error_msg if error_msg else 'No match'}")
@@ -313,6 +886,18 @@ async def detect_head_turn(file: UploadFile = File(...), session_id: str = "defa
                     print(f"⚠️ {direction.capitalize()} turn not confirmed: eyes={eye_count}, time={time_since_last:.2f}s")
             
             session[state_key] = current_state
+            
+            if pose_completed or rejection_reason:
+                audit_log.record(
+                    "head_pose", session_id,
+                    direction=direction,
+                    verdict="accepted" if pose_completed else "rejected",
+                    reason=rejection_reason,
+                    is_profile=bool(is_profile),
+                    is_frontal=bool(is_frontal),
+                    eye_count=int(eye_count),
+                    face_area=int(face_area),
+                )
         else:
             rejection_reason = "No face detected"
             print(f"⚠️ No face detected")
@@ -321,31 +906,43 @@ async def detect_head_turn(file: UploadFile = File(...), session_id: str = "defa
         print(f"📈 {direction.capitalize()} Turn Status: {'✅ Complete' if session[detected_key] else '⏳ Waiting'}")
         print(f"{'='*60}\n")
         
-        if os.path.exists(live_path):
-            os.remove(live_path)
-        
         # Prepare response message
-        if session[detected_key]:
+        if session[f"{direction}_pose_skipped"]:
+            message = f"{direction.capitalize()} turn not required"
+        elif session[detected_key]:
             message = f"{direction.capitalize()} turn verified and ID confirmed!"
         elif rejection_reason:
             message = rejection_reason
         else:
             message = f"Turn your head to the {direction}..."
         
+        if session[detected_key]:
+            challenge_state = STATE_COMPLETE
+        elif not face_detected:
+            challenge_state = STATE_NO_FACE
+        elif is_profile:
+            challenge_state = STATE_TRANSITION
+        else:
+            challenge_state = STATE_TRACKING
+        
         return {
             "face_detected": bool(face_detected),
             "is_profile": bool(is_profile),
             "is_frontal": bool(is_frontal),
             "pose_detected": bool(session[detected_key]),
             "pose_completed": pose_completed,
+            "pose_skipped": bool(session[f"{direction}_pose_skipped"]),
             "id_verified": id_verified,
             "id_distance": float(id_distance) if id_distance is not None else None,
             "id_threshold": float(id_threshold) if id_threshold is not None else None,
+            "detector_tier": verification_tier,
+            "id_references": id_references,
             "direction": direction,
             "face_area": face_area,
             "eye_count": eye_count,
             "session_id": session_id,
             "rejection_reason": rejection_reason,
+            "capture_hints": capture_hints_for(session, challenge_state),
             "message": message
         }
         
@@ -354,9 +951,6 @@ async def detect_head_turn(file: UploadFile = File(...), session_id: str = "defa
         import traceback
         traceback.print_exc()
         
-        if os.path.exists(live_path):
-            os.remove(live_path)
-        
         return {
             "face_detected": False,
             "is_profile": False,
@@ -367,61 +961,51 @@ async def detect_head_turn(file: UploadFile = File(...), session_id: str = "defa
         }
 
 @router.post("/compare")
-async def compare(file: UploadFile = File(...)):
-    global id_path
-    
-    if id_path is None or not os.path.exists(id_path):
+async def compare(file: UploadFile = File(...), session_id: str = None):
+    """
+    Verify one frame against the ID. With a session_id, the session's extra
+    references are compared too and listed per reference.
+    """
+    if not id_available():
         return {
             "match": False,
             "message": "ID not uploaded. Please upload ID first.",
             "no_id": True
         }
     
-    live_path = str(TEMP_DIR / "temp_live.jpg")
-    
     try:
-        with open(live_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
-        
-        result = DeepFace.verify(
-            img1_path=id_path,
-            img2_path=live_path,
-            model_name="ArcFace",
-            enforce_detection=True,
-            detector_backend="mtcnn"
-        )
+        live_image = await read_image(file)
+        session = liveness_sessions.get(session_id) if session_id else None
+        verified, distance, threshold, error_msg, tier, references = await run_in_threadpool(verify_against_id, live_image, session)
+        audit_verification(session_id, "compare", verified, distance, threshold, error_msg, tier, references)
         
-        verified = result["verified"]
-        distance = result["distance"]
-        threshold = result["threshold"]
+        if error_msg:
+            raise ValueError(error_msg)
         
         print(f"{'✅ MATCH' if verified else '❌ NO MATCH'} - Distance: {distance:.4f}, Threshold: {threshold:.4f}")
         
-        if os.path.exists(live_path):
-            os.remove(live_path)
-        
         return {
             "match": bool(verified),
             "distance": float(distance),
             "threshold": float(threshold),
-            "model": result["model"],
-            "detector": result["detector_backend"],
+            "model": face_service.model_name,
+            "detector": DETECTOR_BACKENDS[tier],
+            "detector_tier": tier,
+            "references": references,
+            "capture_hints": hint_advisor.hints(STATE_COMPLETE if verified else STATE_TRACKING),
             "message": "Face verified!" if verified else "Face does not match"
         }
         
     except ValueError as ve:
         error_msg = str(ve).lower()
         
-        if os.path.exists(live_path):
-            os.remove(live_path)
-        
         if "face could not be detected" in error_msg or "no face" in error_msg:
             print("⚠️ No face detected in live frame")
             return {
                 "match": False,
                 "message": "No face detected. Please look at the camera.",
-                "no_face_detected": True
+                "no_face_detected": True,
+                "capture_hints": hint_advisor.hints(STATE_NO_FACE)
             }
         else:
             print(f"⚠️ Verification error: {str(ve)}")
@@ -434,9 +1018,6 @@ async def compare(file: UploadFile = File(...)):
     except Exception as e:
         print(f"❌ Unexpected error during comparison: {str(e)}")
         
-        if os.path.exists(live_path):
-            os.remove(live_path)
-        
         return {
             "match": False,
             "message": f"Verification error: {str(e)}",
@@ -448,6 +1029,8 @@ async def compare(file: UploadFile = File(...)):
 async def reset_liveness_session(request: LivenessResetRequest):
     """Reset a specific liveness verification session"""
     try:
+        frame_coalescer.forget_session(request.session_id)
+        verification_jobs.discard(request.session_id)
         if request.session_id in liveness_sessions:
             del liveness_sessions[request.session_id]
             print(f"✅ Liveness session {request.session_id} cleared")
@@ -466,7 +1049,7 @@ async def reset_liveness_session(request: LivenessResetRequest):
 
 @router.post("/reset")
 async def reset_id():
-    global id_path
+    global id_path, id_embedding, id_applicant_id, pending_applicant
     
     try:
         if id_path and os.path.exists(id_path):
@@ -474,6 +1057,9 @@ async def reset_id():
             print("✅ ID image cleared")
         
         id_path = None
+        id_embedding = None
+        id_applicant_id = None
+        pending_applicant = None
         liveness_sessions.clear()
         
         return {
@@ -490,10 +1076,19 @@ async def reset_id():
 
 @router.get("/health")
 async def health_check():
+    # The probe does socket I/O; keep it off the event loop
+    model_server = await run_in_threadpool(face_service.ping) if MODEL_SOCKET else None
     return {
         "status": "healthy",
-        "id_uploaded": id_path is not None and os.path.exists(id_path) if id_path else False,
-        "active_sessions": len(liveness_sessions)
+        "id_uploaded": id_available(),
+        "model_server": model_server,
+        "active_sessions": len(liveness_sessions),
+        "qos": qos.metrics(),
+        "superseded_frames": frame_coalescer.superseded_count,
+        "verification_jobs": verification_jobs.metrics(),
+        "audit_log": audit_log.metrics(),
+        "indexed_applicants": len(applicant_index),
+        "stored_applicants": len(applicant_store)
     }
 
 
@@ -507,7 +1102,13 @@ async def get_session_status(session_id: str):
             "blink_detected": session["blink_detected"],
             "left_pose_detected": session["left_pose_detected"],
             "right_pose_detected": session["right_pose_detected"],
+            "head_turns_skipped": head_turns_skipped(session),
+            "passive_liveness": session["passive_liveness"],
+            "references": session["reference_labels"],
             "liveness_complete": session["blink_detected"] and session["left_pose_detected"] and session["right_pose_detected"],
+            "applicant_id": session["applicant_id"],
+            "verification_pending": verification_jobs.is_pending(session_id),
+            "verification": session["verification"],
             "created_at": session["created_at"],
             "frame_count": session["frame_count"]
         }
@@ -0,0 +1,274 @@
+"""
+Preforking launcher for app.main:app.
+
+The app is imported once in the parent, then workers are forked and serve
+from a shared listening socket. TensorFlow is not fork-safe (its thread
+pools and runtime state don't survive a fork), so the parent never imports
+it: each worker builds and warms its own DeepFace models right after the
+fork, before it accepts requests. To avoid a copy of the weights per
+worker, run app.model_server and set FACE_MODEL_SOCKET.
+
+The uploaded ID, the pending applicant, the liveness sessions, the frame
+coalescer and the verification job queue all live in the worker's memory,
+so a session's requests must all reach the same worker. Nothing routes them
+that way, hence the default of one worker; more only make sense behind a
+proxy with session affinity.
+
+    python -m app.launcher --port 8000
+
+Signals (to the parent):
+    SIGHUP          rolling restart, one worker at a time
+    SIGTERM/SIGINT  graceful shutdown
+    SIGUSR1         print the per-worker RSS/PSS report
+
+With --cores, the core budget is split between workers and OpenCV,
+TensorFlow and the verification pool are sized to each worker's share
+(see app.services.cpu_budget); --pin also pins each worker to its cores.
+"""
+import argparse
+import atexit
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+
+from app.services.cpu_budget import CpuBudget
+
+
+def load_app():
+    """
+    Import the app pre-fork. Run this before anything starts background
+    threads: threads don't survive fork. Nothing here may import TensorFlow.
+    The Haar cascades are loaded per request thread in the workers, so there
+    is nothing to warm here.
+    """
+    started = time.time()
+    from app.main import app
+
+    print(f"✅ App imported in {time.time() - started:.1f}s")
+    return app
+
+
+def warm_models():
+    """
+    Build and warm the DeepFace models in this process. Called in each
+    worker after the fork; a no-op when DeepFace lives in app.model_server.
+    """
+    import numpy as np
+    from app.api.endpoints import parse_document
+
+    if parse_document.MODEL_SOCKET:
+        print(f"✅ Models served by {parse_document.MODEL_SOCKET}")
+        return
+
+    from deepface import DeepFace
+
+    started = time.time()
+    blank = np.zeros((224, 224, 3), dtype=np.uint8)
+    DeepFace.build_model("ArcFace")
+
+    DeepFace.represent(img_path=blank, model_name="ArcFace", detector_backend="skip", enforce_detection=False)
+    for backend in ("mtcnn", "opencv"):
+        try:
+            DeepFace.extract_faces(img_path=blank, detector_backend=backend, enforce_detection=False)
+        except Exception as e:
+            print(f"⚠️ Warm-up of {backend} detector failed: {str(e)}")
+
+    print(f"✅ Models loaded and warmed in {time.time() - started:.1f}s (pid {os.getpid()})")
+
+
+def memory_usage(pid: int) -> dict:
+    """RSS, PSS and shared/private totals in KB from /proc/<pid>/smaps_rollup."""
+    usage = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0].rstrip(":") in (
+                    "Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty"
+                ):
+                    usage[parts[0].rstrip(":")] = int(parts[1])
+    except OSError:
+        pass
+    return usage
+
+
+class Launcher:
+    def __init__(self, app, host: str, port: int, workers: int, timeout: float, budget: CpuBudget = None):
+        self.app = app
+        self.budget = budget
+        self.host = host
+        self.port = port
+        self.num_workers = workers
+        self.timeout = timeout
+        self.workers = {}  # pid -> worker index
+        self.running = True
+        self.restart_queue = []
+        self.socket = None
+
+    def bind(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(2048)
+        sock.set_inheritable(True)
+        self.socket = sock
+
+    def spawn(self, index: int):
+        pid = os.fork()
+        if pid:
+            self.workers[pid] = index
+            print(f"🚀 Worker {index} started (pid {pid})")
+            return
+
+        # Child: reset signal handlers and hand the socket to uvicorn
+        for sig in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT, signal.SIGUSR1, signal.SIGCHLD):
+            signal.signal(sig, signal.SIG_DFL)
+        if self.budget:
+            self.budget.pin_worker(index)
+            self.budget.apply()
+        warm_models()
+
+        import uvicorn
+        config = uvicorn.Config(self.app, log_level="info")
+        server = uvicorn.Server(config)
+        try:
+            server.run(sockets=[self.socket])
+        finally:
+            # os._exit skips atexit, which unlinks this worker's shared-memory slabs
+            atexit._run_exitfuncs()
+            os._exit(0)
+
+    def stop_worker(self, pid: int):
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            return
+
+        deadline = time.time() + self.timeout
+        while time.time() < deadline:
+            done, _ = os.waitpid(pid, os.WNOHANG)
+            if done:
+                return
+            time.sleep(0.1)
+
+        print(f"⚠️ Worker pid {pid} did not stop in {self.timeout}s, killing")
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+
+    def report(self):
+        parent = memory_usage(os.getpid())
+        print(f"\n{'='*60}")
+        print(f"📊 Memory report (KB) - parent pid {os.getpid()}: RSS {parent.get('Rss', 0)}, PSS {parent.get('Pss', 0)}")
+        total_rss = parent.get("Rss", 0)
+        total_pss = parent.get("Pss", 0)
+        for pid, index in sorted(self.workers.items(), key=lambda item: item[1]):
+            usage = memory_usage(pid)
+            shared = usage.get("Shared_Clean", 0) + usage.get("Shared_Dirty", 0)
+            private = usage.get("Private_Clean", 0) + usage.get("Private_Dirty", 0)
+            total_rss += usage.get("Rss", 0)
+            total_pss += usage.get("Pss", 0)
+            print(
+                f"  Worker {index} (pid {pid}): RSS {usage.get('Rss', 0)}, PSS {usage.get('Pss', 0)}, "
+                f"shared {shared}, private {private}"
+            )
+        print(f"  Total: RSS {total_rss} (naive sum), PSS {total_pss} (actual)")
+        print(f"{'='*60}\n")
+
+    def handle_hup(self, signum, frame):
+        print("🔄 Rolling restart requested")
+        self.restart_queue = list(self.workers)
+
+    def handle_term(self, signum, frame):
+        self.running = False
+
+    def handle_usr1(self, signum, frame):
+        self.report()
+
+    def run(self):
+        self.bind()
+
+        # Move everything allocated so far out of the GC's reach, so collections
+        # in the workers don't touch (and un-share) the parent's pages
+        gc.collect()
+        gc.freeze()
+
+        for index in range(self.num_workers):
+            self.spawn(index)
+
+        signal.signal(signal.SIGHUP, self.handle_hup)
+        signal.signal(signal.SIGTERM, self.handle_term)
+        signal.signal(signal.SIGINT, self.handle_term)
+        signal.signal(signal.SIGUSR1, self.handle_usr1)
+
+        print(f"✅ Serving on {self.host}:{self.port} with {self.num_workers} workers (parent pid {os.getpid()})")
+
+        while self.running:
+            # Reap crashed workers and replace them
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                pid, status = 0, 0
+            if pid and pid in self.workers:
+                index = self.workers.pop(pid)
+                print(f"❌ Worker {index} (pid {pid}) exited with status {status}, respawning")
+                self.spawn(index)
+
+            if self.restart_queue:
+                pid = self.restart_queue.pop(0)
+                if pid in self.workers:
+                    index = self.workers.pop(pid)
+                    self.spawn(index)
+                    self.stop_worker(pid)
+                    print(f"🔄 Worker {index} restarted")
+
+            time.sleep(0.5)
+
+        print("🛑 Shutting down workers")
+        for pid in list(self.workers):
+            self.stop_worker(pid)
+        self.workers.clear()
+        self.socket.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Preforking launcher for the facial verification API")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Worker processes; sessions are per worker, so >1 needs session affinity")
+    parser.add_argument("--cores", type=int, default=None,
+                        help="Total core budget shared by all workers (default: don't manage threads)")
+    parser.add_argument("--pin", action="store_true", help="Pin each worker to its share of the cores")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Seconds to wait for a worker to stop")
+    parser.add_argument("--report-after", type=float, default=0.0,
+                        help="Print a memory report this many seconds after start (0 to disable)")
+    args = parser.parse_args(argv)
+
+    budget = None
+    if args.cores:
+        budget = CpuBudget(args.cores, args.workers, args.pin)
+        budget.apply_env()
+        # TensorFlow pools are sized in each worker, after the fork
+        budget.apply(tensorflow=False)
+        print(f"⚙️ CPU budget: {budget.describe()}")
+
+    if args.workers > 1:
+        print(f"⚠️ {args.workers} workers: sessions and the uploaded ID are per worker, "
+              "so each session's requests must be routed to one worker")
+
+    app = load_app()
+    launcher = Launcher(app, args.host, args.port, args.workers, args.timeout, budget)
+
+    if args.report_after > 0:
+        signal.signal(signal.SIGALRM, lambda signum, frame: launcher.report())
+        signal.alarm(int(args.report_after))
+
+    launcher.run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
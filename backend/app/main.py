@@ -1,11 +1,26 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from app.services.cpu_budget import CpuBudget
+
+# Thread-count env vars must be exported before cv2/numpy/TensorFlow load
+cpu_budget = CpuBudget.from_env()
+if cpu_budget:
+    cpu_budget.apply_env()
+
 from app.api.endpoints import parse_document
+from app.services.upload_reader import RequestSizeLimit
+
+if cpu_budget:
+    # Importing TensorFlow here would happen before the launcher forks; it is
+    # loaded lazily instead and picks up the TF_NUM_* variables set above
+    cpu_budget.apply(tensorflow=False)
 
 
 
 app = FastAPI()
 
+app.add_middleware(RequestSizeLimit)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -14,4 +29,17 @@ app.add_middleware(
 )
 
 
-app.include_router(parse_document.router,prefix="/api/facial/v1")
\ No newline at end of file
+@app.middleware("http")
+async def track_load(request: Request, call_next):
+    # Requests in flight feed the verification QoS controller
+    with parse_document.qos.track_request():
+        return await call_next(request)
+
+
+@app.on_event("shutdown")
+def stop_background_work():
+    parse_document.verification_jobs.shutdown(wait=False)
+    parse_document.audit_log.close()
+
+
+app.include_router(parse_document.router,prefix="/api/facial/v1")
@@ -0,0 +1,127 @@
+"""
+ArcFace/DeepFace model server for the liveness API.
+
+Runs the heavy verification models in their own processes so the API
+workers only need OpenCV. API workers reach it over a Unix socket when
+FACE_MODEL_SOCKET is set (see app.services.model_client).
+
+    python -m app.model_server --socket /tmp/tuloan-models.sock --workers 2
+    FACE_MODEL_SOCKET=/tmp/tuloan-models.sock uvicorn app.main:app --workers 8
+
+The socket is bound once and the workers are forked afterwards, all
+accepting on it. TensorFlow is not fork-safe, so each worker (the parent
+included) builds and warms its own models after the fork.
+"""
+import argparse
+import os
+import signal
+import socketserver
+import sys
+import time
+
+import numpy as np
+
+from app.services.face_recognition import FaceRecognitionService
+from app.services.model_client import DEFAULT_SOCKET, send_message, recv_message
+
+face_service = None
+
+
+def handle_request(message: dict):
+    op = message.get("op")
+    args = message.get("args", {})
+
+    if op == "ping":
+        return "pong"
+    if op == "verify":
+        # A path would be resolved against this server's cwd, not the client's
+        if isinstance(args["live_image"], str) or isinstance(args["id_image"], str):
+            raise ValueError("verify takes image arrays, not paths")
+        return list(face_service.verify_against_id(args["live_image"], args["id_image"], args["detector_backend"]))
+    if op == "represent_face":
+        embedding, box = face_service.represent_face(args["image"], args["detector_backend"])
+        return [embedding, list(box)]
+    raise ValueError(f"Unknown operation: {op}")
+
+
+class ModelRequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                message = recv_message(self.request)
+            except (ConnectionError, OSError):
+                return
+
+            try:
+                response = {"ok": True, "result": handle_request(message)}
+            except Exception as e:
+                response = {"ok": False, "error": str(e), "error_type": type(e).__name__}
+
+            try:
+                send_message(self.request, response)
+            except OSError:
+                return
+
+
+class ModelServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def warm_up():
+    from deepface import DeepFace
+
+    started = time.time()
+    DeepFace.build_model(face_service.model_name)
+    blank = np.zeros((224, 224, 3), dtype=np.uint8)
+    DeepFace.represent(img_path=blank, model_name=face_service.model_name, detector_backend="skip", enforce_detection=False)
+    for backend in ("mtcnn", "opencv"):
+        try:
+            DeepFace.extract_faces(img_path=blank, detector_backend=backend, enforce_detection=False)
+        except Exception as e:
+            print(f"⚠️ Warm-up of {backend} detector failed: {str(e)}")
+    print(f"✅ Model server warmed up in {time.time() - started:.1f}s")
+
+
+def main(argv=None):
+    global face_service
+
+    parser = argparse.ArgumentParser(description="DeepFace model server for the liveness API")
+    parser.add_argument("--socket", default=os.getenv("FACE_MODEL_SOCKET", DEFAULT_SOCKET))
+    parser.add_argument("--workers", type=int, default=1, help="Model worker processes sharing the socket")
+    args = parser.parse_args(argv)
+
+    if os.path.exists(args.socket):
+        os.remove(args.socket)
+    server = ModelServer(args.socket, ModelRequestHandler)
+    os.chmod(args.socket, 0o660)
+
+    children = []
+    is_parent = True
+    for _ in range(args.workers - 1):
+        pid = os.fork()
+        if pid == 0:
+            children = []
+            is_parent = False
+            break
+        children.append(pid)
+
+    def shutdown(signum, frame):
+        if is_parent:
+            for pid in children:
+                os.kill(pid, signal.SIGTERM)
+            if os.path.exists(args.socket):
+                os.remove(args.socket)
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    face_service = FaceRecognitionService()
+    warm_up()
+
+    print(f"✅ Model server (pid {os.getpid()}) listening on {args.socket}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+"""
+Bulk offline re-verification of (ID photo, selfie) pairs.
+
+    python -m app.reverify manifest.csv --output results.csv --workers 4
+    python -m app.reverify manifest.jsonl --output results.parquet --detector opencv
+
+The manifest is a CSV file with a header row, or JSON lines, with id_path and
+selfie_path fields; pair_id is optional and defaults to the row number.
+It is streamed, never loaded whole.
+
+Each worker process keeps an LRU cache of ID embeddings, so an ID that
+appears in many pairs is embedded once per worker. Sorting the manifest
+by id_path gives the most cache hits.
+
+Results are appended to the output as pairs finish and double as the
+checkpoint: rerunning with the same output skips pairs already written.
+Parquet output (needs pyarrow) is converted from that progress file once
+the run completes.
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from app.services.cpu_budget import CpuBudget
+
+RESULT_FIELDS = (
+    "pair_id", "id_path", "selfie_path", "verified", "distance", "threshold",
+    "detector", "id_cached", "error", "elapsed_ms",
+)
+
+# Per-worker state, set up by _init_worker
+_service = None
+_detector = None
+_id_cache = None
+_id_cache_size = 0
+
+
+def _init_worker(budget: CpuBudget, detector: str, cache_size: int):
+    global _service, _detector, _id_cache, _id_cache_size
+
+    # Size the thread pools before cv2/TensorFlow are imported in this process
+    budget.apply_env()
+    budget.apply()
+
+    from app.services.face_recognition import FaceRecognitionService
+    _service = FaceRecognitionService()
+    _detector = detector
+    _id_cache = OrderedDict()
+    _id_cache_size = cache_size
+
+
+def _load(path: str):
+    """Decode with the same size cap as uploads, at a reduced JPEG scale where possible."""
+    from app.services.upload_reader import sniff_format, image_dimensions, decode_image
+
+    with open(path, "rb") as f:
+        content = f.read()
+    return decode_image(content, image_dimensions(content, sniff_format(content[:16])))
+
+
+def _id_embedding(path: str) -> tuple:
+    """
+    Embedding of an ID photo, from the cache when possible.
+    Failures are cached too, so a bad ID isn't retried for every pair.
+    Returns: (embedding, error, cached)
+    """
+    entry = _id_cache.get(path)
+    if entry is not None:
+        _id_cache.move_to_end(path)
+        return entry + (True,)
+
+    try:
+        entry = (_service.represent(_load(path), _detector), None)
+    except Exception as e:
+        entry = (None, f"ID: {str(e)}")
+
+    _id_cache[path] = entry
+    if len(_id_cache) > _id_cache_size:
+        _id_cache.popitem(last=False)
+    return entry + (False,)
+
+
+def _verify_pair(row: dict) -> dict:
+    from app.services.face_recognition import ARCFACE_COSINE_THRESHOLD, cosine_distance
+
+    started = time.time()
+    result = {
+        "pair_id": row["pair_id"],
+        "id_path": row["id_path"],
+        "selfie_path": row["selfie_path"],
+        "verified": False,
+        "distance": None,
+        "threshold": ARCFACE_COSINE_THRESHOLD,
+        "detector": _detector,
+        "id_cached": False,
+        "error": None,
+    }
+
+    id_embedding, error, result["id_cached"] = _id_embedding(row["id_path"])
+    if error is None:
+        try:
+            selfie_embedding = _service.represent(_load(row["selfie_path"]), _detector)
+            distance = cosine_distance(id_embedding, selfie_embedding)
+            result["distance"] = round(distance, 6)
+            result["verified"] = distance <= ARCFACE_COSINE_THRESHOLD
+        except Exception as e:
+            error = f"Selfie: {str(e)}"
+
+    result["error"] = error
+    result["elapsed_ms"] = round((time.time() - started) * 1000, 1)
+    return result
+
+
+def _verify_chunk(rows: list) -> list:
+    return [_verify_pair(row) for row in rows]
+
+
+def read_manifest(path: str):
+    """Yield manifest rows as dicts with pair_id, id_path and selfie_path."""
+    with open(path, newline="") as f:
+        if path.endswith((".jsonl", ".ndjson")):
+            rows = (json.loads(line) for line in f if line.strip())
+        else:
+            rows = csv.DictReader(f)
+
+        for number, row in enumerate(rows, start=1):
+            if not row.get("id_path") or not row.get("selfie_path"):
+                print(f"⚠️ Manifest row {number} has no id_path/selfie_path, skipped")
+                continue
+            yield {
+                "pair_id": str(row.get("pair_id") or number),
+                "id_path": row["id_path"],
+                "selfie_path": row["selfie_path"],
+            }
+
+
+def completed_pairs(progress_path: str) -> set:
+    """pair_ids already in the progress file of an earlier run."""
+    if not os.path.exists(progress_path):
+        return set()
+    with open(progress_path, newline="") as f:
+        return {row["pair_id"] for row in csv.DictReader(f)}
+
+
+def chunks(rows, size: int):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class RunStats:
+    def __init__(self, resumed: int):
+        self.started = time.time()
+        self.resumed = resumed
+        self.done = 0
+        self.matched = 0
+        self.errors = 0
+        self.id_cache_hits = 0
+        self.latencies = []
+
+    def add(self, result: dict):
+        self.done += 1
+        self.matched += bool(result["verified"])
+        self.errors += result["error"] is not None
+        self.id_cache_hits += bool(result["id_cached"])
+        self.latencies.append(result["elapsed_ms"])
+
+    def line(self) -> str:
+        elapsed = time.time() - self.started
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        hit_rate = self.id_cache_hits / self.done if self.done else 0.0
+        return (
+            f"{self.done} pairs in {elapsed:.0f}s ({rate:.1f} pairs/s) - "
+            f"{self.matched} match, {self.errors} errors, ID cache hits {hit_rate:.0%}"
+        )
+
+    def summary(self) -> str:
+        latencies = sorted(self.latencies)
+        if not latencies:
+            return f"Nothing to do ({self.resumed} pairs already done)"
+        p50 = latencies[len(latencies) // 2]
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        return (
+            f"{self.line()}\n"
+            f"  per-pair latency p50 {p50:.0f} ms, p95 {p95:.0f} ms; "
+            f"{self.resumed} pairs skipped from an earlier run"
+        )
+
+
+def write_parquet(progress_path: str, output: str):
+    import pyarrow.csv
+    import pyarrow.parquet
+
+    table = pyarrow.csv.read_csv(progress_path)
+    pyarrow.parquet.write_table(table, output)
+    os.remove(progress_path)
+
+
+def run(args) -> RunStats:
+    parquet = args.output.endswith(".parquet")
+    progress_path = args.output + ".progress.csv" if parquet else args.output
+
+    done = completed_pairs(progress_path)
+    if done:
+        print(f"↩️ Resuming: {len(done)} pairs already in {progress_path}")
+    stats = RunStats(resumed=len(done))
+
+    budget = CpuBudget(args.cores, args.workers)
+    pending_rows = (row for row in read_manifest(args.manifest) if row["pair_id"] not in done)
+    work = chunks(pending_rows, args.chunk_size)
+    max_in_flight = args.workers * 4
+
+    new_file = not os.path.exists(progress_path) or os.path.getsize(progress_path) == 0
+    with open(progress_path, "a", newline="") as out, ProcessPoolExecutor(
+        max_workers=args.workers,
+        # Spawn, not fork: each worker loads TensorFlow under its own thread budget
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(budget, args.detector, args.id_cache_size),
+    ) as pool:
+        writer = csv.DictWriter(out, fieldnames=RESULT_FIELDS)
+        if new_file:
+            writer.writeheader()
+
+        in_flight = set()
+        last_report = time.time()
+        exhausted = False
+        while in_flight or not exhausted:
+            # Keep a bounded window of chunks in flight so the manifest is streamed
+            while not exhausted and len(in_flight) < max_in_flight:
+                chunk = next(work, None)
+                if chunk is None:
+                    exhausted = True
+                else:
+                    in_flight.add(pool.submit(_verify_chunk, chunk))
+            if not in_flight:
+                break
+
+            finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                for result in future.result():
+                    writer.writerow(result)
+                    stats.add(result)
+            # The output is the checkpoint; make each finished chunk durable
+            out.flush()
+
+            if time.time() - last_report >= args.report_every:
+                print(f"⏳ {stats.line()}")
+                last_report = time.time()
+
+    if parquet:
+        write_parquet(progress_path, args.output)
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-run ID/selfie face matching over a manifest of pairs")
+    parser.add_argument("manifest", help="CSV or JSONL with id_path, selfie_path and optional pair_id")
+    parser.add_argument("--output", required=True, help="Results file (.csv, or .parquet with pyarrow)")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--cores", type=int, default=None, help="Total core budget (default: all)")
+    parser.add_argument("--detector", default="mtcnn", help="DeepFace detector backend")
+    parser.add_argument("--chunk-size", type=int, default=16, help="Pairs per task sent to a worker")
+    parser.add_argument("--id-cache-size", type=int, default=1024, help="ID embeddings cached per worker")
+    parser.add_argument("--report-every", type=float, default=10.0, help="Seconds between progress lines")
+    args = parser.parse_args(argv)
+
+    if args.output.endswith(".parquet"):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            sys.exit("Parquet output needs pyarrow (pip install pyarrow), or use a .csv output")
+
+    stats = run(args)
+    print(f"✅ {stats.summary()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,158 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 import cv2
+import numpy as np
+from app.services.image_utils import load_image, crop_to_frame, ThreadLocalCascade
+
+# Neighbour offsets (dy, dx) of the 8-bit LBP code, clockwise from top-left
+LBP_OFFSETS = ((-1, -1), (-1, 0), (-1, 1), (0, 1), (1, 1), (1, 0), (1, -1), (0, -1))
+
+# Cascades used by HeadPoseEngine, by name
+HEAD_POSE_CASCADES = {
+    "frontal": "haarcascade_frontalface_default.xml",
+    "profile": "haarcascade_profileface.xml",
+    "eye": "haarcascade_eye.xml",
+}
+
+DECISION_LIVE = "live"
+DECISION_UNCERTAIN = "uncertain"
+DECISION_SUSPICIOUS = "suspicious"
+# A live_threshold no score can reach (scores are 0-1), so nothing is "live"
+PASSIVE_SKIP_DISABLED = 1.01
+
+
+def _ramp(value: float, low: float, high: float) -> float:
+    """Map value linearly onto [0, 1] between low and high (high may be below low)."""
+    return float(np.clip((value - low) / (high - low), 0.0, 1.0))
+
+
+def lbp_entropy(gray: np.ndarray) -> float:
+    """Entropy in bits of the 8-neighbour LBP code histogram of a grayscale image."""
+    center = gray[1:-1, 1:-1]
+    h, w = gray.shape
+    codes = np.zeros(center.shape, dtype=np.uint8)
+    for bit, (dy, dx) in enumerate(LBP_OFFSETS):
+        neighbour = gray[1 + dy:h - 1 + dy, 1 + dx:w - 1 + dx]
+        codes |= (neighbour >= center).astype(np.uint8) << bit
+
+    hist = np.bincount(codes.ravel(), minlength=256).astype(np.float64)
+    hist = hist[hist > 0] / codes.size
+    return float(-(hist * np.log2(hist)).sum())
+
+
+def moire_peak_ratio(gray: np.ndarray) -> float:
+    """
+    log10 of the strongest high-frequency peak over the median of the band.
+    Screen replays alias the display's pixel grid into sharp isolated peaks;
+    skin and camera noise spread their energy evenly.
+    """
+    h, w = gray.shape
+    window = np.outer(np.hanning(h), np.hanning(w))
+    spectrum = np.abs(np.fft.fftshift(np.fft.fft2((gray - gray.mean()) * window)))
+
+    fy = np.fft.fftshift(np.fft.fftfreq(h))[:, None]
+    fx = np.fft.fftshift(np.fft.fftfreq(w))[None, :]
+    radius = np.sqrt(fx ** 2 + fy ** 2) / 0.5  # 1.0 = Nyquist
+    band = spectrum[(radius > 0.35) & (radius < 0.9)]
+    median = float(np.median(band))
+    if median <= 0:
+        return 0.0
+    return float(np.log10(band.max() / median))
+
+
+def specular_fraction(face_bgr: np.ndarray) -> float:
+    """Fraction of bright, colourless pixels: glare off a screen or glossy print."""
+    hsv = cv2.cvtColor(face_bgr, cv2.COLOR_BGR2HSV)
+    highlights = (hsv[..., 2] >= 240) & (hsv[..., 1] <= 40)
+    return float(highlights.mean())
+
 
 class AntiSpoof:
-    def __init__(self):
-        pass
+    """
+    Passive presentation-attack score from a single frontal frame.
+
+    Three cheap cues are computed on the face crop and mapped onto a 0-1
+    liveness scale:
+      - texture: LBP entropy; prints and replays lose skin micro-texture
+      - moire:   high-frequency spectral peaks from a display's pixel grid
+      - specular: share of glare pixels from a screen or glossy photo
+    The weighted mean is the score. Only scores at or above live_threshold
+    count as "live". The ramps are uncalibrated guesses, so by default no
+    score reaches "live" (PASSIVE_SKIP_DISABLED); set a threshold once they
+    have been calibrated against the deployment's own captures.
+    """
+
+    CROP_SIZE = 128
+    # (low, high) of each ramp: feature value at liveness 0 and 1
+    TEXTURE_RAMP = (4.5, 6.5)
+    MOIRE_RAMP = (2.2, 1.4)
+    SPECULAR_RAMP = (0.08, 0.01)
+    WEIGHTS = {"texture": 0.4, "moire": 0.35, "specular": 0.25}
+
+    def __init__(self, live_threshold: float = PASSIVE_SKIP_DISABLED, suspicious_threshold: float = 0.4):
+        self.live_threshold = live_threshold
+        self.suspicious_threshold = suspicious_threshold
+        self.face_cascade = ThreadLocalCascade('haarcascade_frontalface_default.xml')
 
+    def _face_region(self, img: np.ndarray, face_box: tuple = None):
+        if face_box is None:
+            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+            faces = self.face_cascade.detectMultiScale(gray, 1.2, 4, minSize=(60, 60))
+            if len(faces) == 0:
+                return None
+            face_box = max(faces, key=lambda f: f[2] * f[3])
+
+        x, y, w, h = [int(v) for v in face_box]
+        region = img[max(y, 0):y + h, max(x, 0):x + w]
+        return region if region.size else None
+
+    def score(self, image, face_box: tuple = None) -> dict:
+        """
+        Score one frame. face_box is the (x, y, w, h) of the face inside this
+        image; without it the largest frontal face is detected here.
+        Returns: {"score", "decision", "cues", "features"}, or None when no face is found.
+        """
+        img = load_image(image)
+        if img is None:
+            return None
+        face = self._face_region(img, face_box)
+        if face is None:
+            return None
+
+        face = cv2.resize(face, (self.CROP_SIZE, self.CROP_SIZE), interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(face, cv2.COLOR_BGR2GRAY)
+
+        features = {
+            "lbp_entropy": lbp_entropy(gray),
+            "moire_peak": moire_peak_ratio(gray.astype(np.float32)),
+            "specular_fraction": specular_fraction(face),
+        }
+        cues = {
+            "texture": _ramp(features["lbp_entropy"], *self.TEXTURE_RAMP),
+            "moire": _ramp(features["moire_peak"], *self.MOIRE_RAMP),
+            "specular": _ramp(features["specular_fraction"], *self.SPECULAR_RAMP),
+        }
+        score = sum(self.WEIGHTS[name] * value for name, value in cues.items())
+
+        if score >= self.live_threshold:
+            decision = DECISION_LIVE
+        elif score <= self.suspicious_threshold:
+            decision = DECISION_SUSPICIOUS
+        else:
+            decision = DECISION_UNCERTAIN
+
+        print(f"  🛡️ Passive liveness: {score:.2f} ({decision}) - " + ", ".join(f"{k}={v:.2f}" for k, v in cues.items()))
+
+        return {
+            "score": round(score, 4),
+            "decision": decision,
+            "cues": {name: round(value, 4) for name, value in cues.items()},
+            "features": {name: round(value, 4) for name, value in features.items()},
+        }
+
+    @staticmethod
     def detect_blink_opencv(image_path: str):
         """
         Detect blinks using OpenCV's Haar Cascade for eyes.
@@ -90,145 +239,269 @@ class AntiSpoof:
 
 
 
-def detect_head_pose(image_path: str):
-    """
-    Detect head pose and determine if the user is showing their left or right facial profile.
-    Returns:
-        (face_detected, head_direction, face_area, eye_count, is_frontal)
-        head_direction ∈ {"frontal", "left_profile", "right_profile", "slight_turn"}
-    """
-    try:
-        img = cv2.imread(image_path)
-        if img is None:
-            print("❌ Could not read image")
-            return False, "unknown", 0, 0, False
+def usable_cores() -> int:
+    """Cores this process may run on."""
+    return len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
 
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        height, width = gray.shape
 
-        face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-        profile_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_profileface.xml')
-        eye_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_eye.xml')
+class HeadPoseEngine:
+    """
+    Head-pose detection with the three full-frame cascade scans (frontal,
+    profile, profile on the mirrored frame) running in parallel on a thread
+    pool shared by all requests; OpenCV releases the GIL while it scans.
+    The pool defaults to one thread per usable core. Scans that find no free
+    pool thread run in the request thread instead of queueing, so under
+    concurrent sessions throughput still scales with the request threads.
+
+    A profile found with at least `confident_neighbors` overlapping hits is
+    decisive: once the frontal scan can no longer outrank it, the result is
+    returned without waiting for the opposite profile scan, and the eye scan
+    is skipped. Cascades are per thread since CascadeClassifier isn't
+    thread-safe.
+    """
 
-        # Detect frontal faces with more lenient parameters
-        frontal_faces = face_cascade.detectMultiScale(
-            gray, 
-            scaleFactor=1.1,  # More sensitive
-            minNeighbors=4,   # Lower threshold
-            minSize=(30, 30)
-        )
-        
-        # Detect profile faces - check both normal and flipped for left/right
-        profile_faces_right = profile_cascade.detectMultiScale(
+    def __init__(self, threads: int = None, confident_neighbors: int = 8):
+        self.threads = max(1, threads or usable_cores())
+        self.confident_neighbors = confident_neighbors
+        self._local = threading.local()
+        self._executor = None
+        self._executor_pid = None
+        self._executor_lock = threading.Lock()
+        self._busy = 0
+
+    def _pool(self) -> ThreadPoolExecutor:
+        # Pool threads don't survive fork; each worker process starts its own
+        with self._executor_lock:
+            if self._executor_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="head-pose")
+                self._executor_pid = os.getpid()
+                self._busy = 0
+            return self._executor
+
+    def _claim(self, scans: int) -> int:
+        """Reserve up to `scans` idle pool threads; returns how many were reserved."""
+        with self._executor_lock:
+            claimed = max(0, min(scans, self.threads - self._busy))
+            self._busy += claimed
+            return claimed
+
+    def _release(self, _future=None):
+        with self._executor_lock:
+            self._busy -= 1
+
+    def _cascades(self) -> dict:
+        cascades = getattr(self._local, "cascades", None)
+        if cascades is None:
+            cascades = {
+                name: cv2.CascadeClassifier(cv2.data.haarcascades + filename)
+                for name, filename in HEAD_POSE_CASCADES.items()
+            }
+            self._local.cascades = cascades
+        return cascades
+
+    def _largest(self, cascade_name: str, gray, min_neighbors: int):
+        """Largest detection of one cascade as (box, neighbours), or None."""
+        faces, neighbours = self._cascades()[cascade_name].detectMultiScale2(
             gray,
             scaleFactor=1.1,
-            minNeighbors=3,
-            minSize=(30, 30)
-        )
-        
-        # Flip image to detect left profiles
-        flipped_gray = cv2.flip(gray, 1)
-        profile_faces_left = profile_cascade.detectMultiScale(
-            flipped_gray,
-            scaleFactor=1.1,
-            minNeighbors=3,
+            minNeighbors=min_neighbors,
             minSize=(30, 30)
         )
+        if len(faces) == 0:
+            return None
+        best = max(range(len(faces)), key=lambda i: faces[i][2] * faces[i][3])
+        return tuple(int(v) for v in faces[best]), int(neighbours[best])
 
-        # Determine which detection to use
-        all_detections = []
-        
-        if len(frontal_faces) > 0:
-            face = max(frontal_faces, key=lambda f: f[2] * f[3])
-            all_detections.append(("frontal", face, face[2] * face[3]))
-        
-        if len(profile_faces_right) > 0:
-            face = max(profile_faces_right, key=lambda f: f[2] * f[3])
-            all_detections.append(("right_profile", face, face[2] * face[3]))
-        
-        if len(profile_faces_left) > 0:
-            face = max(profile_faces_left, key=lambda f: f[2] * f[3])
-            # Convert coordinates back from flipped image
-            x, y, w, h = face
-            face = (width - x - w, y, w, h)
-            all_detections.append(("left_profile", face, face[2] * face[3]))
-
-        if not all_detections:
-            print("❌ No face detected")
-            return False, "unknown", 0, 0, False
+    def _confident_profile(self, face_type: str, neighbours: int) -> bool:
+        return face_type != "frontal" and neighbours >= self.confident_neighbors
 
-        # Use the largest detection
-        face_type, (x, y, w, h), face_area = max(all_detections, key=lambda d: d[2])
-        print(f"✅ {face_type.replace('_', ' ').title()} detected - Area: {face_area}")
-
-        # Crop ROI for eyes (upper 60% of face)
-        x, y, w, h = int(x), int(y), int(w), int(h)
-        roi_y_end = int(y + h * 0.6)
-        roi_gray = gray[y:roi_y_end, x:x+w]
-        
-        eyes = eye_cascade.detectMultiScale(
-            roi_gray,
-            scaleFactor=1.1,
-            minNeighbors=3,
-            minSize=(15, 15)
+    def _scan(self, gray, width: int) -> list:
+        """
+        Run the three scans concurrently.
+        Returns: [(face_type, (x, y, w, h), area, neighbours)] in frame orientation
+        """
+        jobs = [
+            # Lower neighbour threshold for frontal faces: more sensitive
+            ("frontal", "frontal", gray, 4),
+            ("right_profile", "profile", gray, 3),
+            # Mirrored frame: the profile cascade only finds one side
+            ("left_profile", "profile", cv2.flip(gray, 1), 3),
+        ]
+        pool = self._pool()
+        pooled = self._claim(len(jobs))
+        scans = {}
+        for face_type, cascade_name, frame, min_neighbors in jobs[:pooled]:
+            future = pool.submit(self._largest, cascade_name, frame, min_neighbors)
+            future.add_done_callback(self._release)
+            scans[future] = face_type
+
+        detections = {}
+        pending = set(scans)
+        # Pool saturated by other sessions: run the remaining scans here
+        inline = jobs[pooled:]
+        while inline:
+            face_type, cascade_name, frame, min_neighbors = inline.pop(0)
+            self._record(detections, face_type, self._largest(cascade_name, frame, min_neighbors), width)
+            remaining = [scans[f] for f in pending] + [job[0] for job in inline]
+            if self._can_stop(detections, remaining):
+                for other in pending:
+                    other.cancel()
+                print(f"⏩ Confident profile, skipped {len(remaining)} scan(s)")
+                return list(detections.values())
+
+        for future in as_completed(scans):
+            pending.discard(future)
+            self._record(detections, scans[future], future.result(), width)
+            if self._can_stop(detections, [scans[f] for f in pending]):
+                for other in pending:
+                    other.cancel()
+                print(f"⏩ Confident profile, skipped waiting for {len(pending)} scan(s)")
+                break
+
+        return list(detections.values())
+
+    def _record(self, detections: dict, face_type: str, found, width: int):
+        if found is not None:
+            (x, y, w, h), neighbours = found
+            if face_type == "left_profile":
+                # Convert coordinates back from flipped image
+                x = width - x - w
+            detections[face_type] = (face_type, (x, y, w, h), w * h, neighbours)
+
+    def _can_stop(self, detections: dict, remaining: list) -> bool:
+        """True when the scans still to come can't change the result."""
+        return bool(remaining) and "frontal" not in remaining and self._decisive(detections)
+
+    def _decisive(self, detections: dict) -> bool:
+        frontal_area = detections["frontal"][2] if "frontal" in detections else 0
+        return any(
+            self._confident_profile(face_type, neighbours) and area > frontal_area
+            for face_type, _, area, neighbours in detections.values()
         )
-        eye_count = len(eyes)
-        print(f"👁️ Eyes detected: {eye_count}")
-
-        # Analyze face position in frame for additional profile detection
-        face_center_x = x + w / 2
-        image_center_x = width / 2
-        shift_ratio = (face_center_x - image_center_x) / (width / 2)
-
-        # Determine head direction with multi-factor analysis
-        is_frontal = False
-        head_direction = "unknown"
-
-        if eye_count >= 2 and face_type == "frontal":
-            # Both eyes visible and frontal detector triggered
-            head_direction = "frontal"
-            is_frontal = True
-            
-        elif face_type == "left_profile" or (eye_count <= 1 and shift_ratio > 0.15):
-            # Left profile detector OR single eye with rightward shift
-            head_direction = "left_profile"
-            is_frontal = False
+
+    def detect(self, image_path, geometry: dict = None, crop_box: tuple = None, frame_size: tuple = None):
+        """
+        Detect head pose and determine if the user is showing their left or right facial profile.
+        image_path may also be encoded bytes or a decoded BGR array.
+        If the image is a face crop, pass its crop_box (x, y, w, h) and the
+        original frame_size (w, h); the horizontal shift is then measured against
+        the full frame, not the crop.
+        If a geometry dict is passed, it is filled with "frame_size" (w, h) and
+        "face_box" (x, y, w, h) of the chosen detection in frame coordinates.
+        Returns:
+            (face_detected, head_direction, face_area, eye_count, is_frontal)
+            head_direction ∈ {"frontal", "left_profile", "right_profile", "slight_turn"}
+        """
+        try:
+            img = load_image(image_path)
+            if img is None:
+                print("❌ Could not read image")
+                return False, "unknown", 0, 0, False
+
+            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+            height, width = gray.shape
+            frame_width = frame_size[0] if crop_box else width
+            if geometry is not None:
+                geometry["frame_size"] = tuple(frame_size) if crop_box else (int(width), int(height))
+
+            all_detections = self._scan(gray, width)
+
+            if not all_detections:
+                print("❌ No face detected")
+                return False, "unknown", 0, 0, False
+
+            # Use the largest detection
+            face_type, (x, y, w, h), face_area, neighbours = max(all_detections, key=lambda d: d[2])
+            print(f"✅ {face_type.replace('_', ' ').title()} detected - Area: {face_area}, neighbours: {neighbours}")
+
+            # Crop ROI for eyes (upper 60% of face)
+            x, y, w, h = int(x), int(y), int(w), int(h)
+            frame_box = crop_to_frame((x, y, w, h), gray.shape, crop_box) if crop_box else (x, y, w, h)
+            if geometry is not None:
+                geometry["face_box"] = frame_box
+            if self._confident_profile(face_type, neighbours):
+                # The profile verdict doesn't depend on the eyes, and a clear
+                # profile shows at most one
+                eye_count = 0
+                print("👁️ Eye scan skipped (confident profile)")
+            else:
+                roi_y_end = int(y + h * 0.6)
+                roi_gray = gray[y:roi_y_end, x:x+w]
             
-        elif face_type == "right_profile" or (eye_count <= 1 and shift_ratio < -0.15):
-            # Right profile detector OR single eye with leftward shift
-            head_direction = "right_profile"
+                eyes = self._cascades()["eye"].detectMultiScale(
+                    roi_gray,
+                    scaleFactor=1.1,
+                    minNeighbors=3,
+                    minSize=(15, 15)
+                )
+                eye_count = len(eyes)
+                print(f"👁️ Eyes detected: {eye_count}")
+
+            # Analyze face position in frame for additional profile detection
+            face_center_x = frame_box[0] + frame_box[2] / 2
+            image_center_x = frame_width / 2
+            shift_ratio = (face_center_x - image_center_x) / (frame_width / 2)
+
+            # Determine head direction with multi-factor analysis
             is_frontal = False
+            head_direction = "unknown"
+
+            if eye_count >= 2 and face_type == "frontal":
+                # Both eyes visible and frontal detector triggered
+                head_direction = "frontal"
+                is_frontal = True
             
-        elif eye_count == 1:
-            # Single eye detected but not clear profile - use position
-            if shift_ratio > 0.05:
+            elif face_type == "left_profile" or (eye_count <= 1 and shift_ratio > 0.15):
+                # Left profile detector OR single eye with rightward shift
                 head_direction = "left_profile"
-            elif shift_ratio < -0.05:
+                is_frontal = False
+            
+            elif face_type == "right_profile" or (eye_count <= 1 and shift_ratio < -0.15):
+                # Right profile detector OR single eye with leftward shift
                 head_direction = "right_profile"
-            else:
-                head_direction = "slight_turn"
-            is_frontal = False
+                is_frontal = False
             
-        elif face_type == "frontal":
-            # Frontal detected but not both eyes - might be slight turn
-            if abs(shift_ratio) > 0.1:
-                head_direction = "slight_turn"
+            elif eye_count == 1:
+                # Single eye detected but not clear profile - use position
+                if shift_ratio > 0.05:
+                    head_direction = "left_profile"
+                elif shift_ratio < -0.05:
+                    head_direction = "right_profile"
+                else:
+                    head_direction = "slight_turn"
+                is_frontal = False
+            
+            elif face_type == "frontal":
+                # Frontal detected but not both eyes - might be slight turn
+                if abs(shift_ratio) > 0.1:
+                    head_direction = "slight_turn"
+                else:
+                    head_direction = "frontal"
+                is_frontal = False
             else:
-                head_direction = "frontal"
-            is_frontal = False
-        else:
-            head_direction = "slight_turn"
-            is_frontal = False
+                head_direction = "slight_turn"
+                is_frontal = False
+
+            print(f"🧠 Head Direction: {head_direction} (shift: {shift_ratio:.2f})")
+
+            # For API compatibility: convert to boolean is_profile
+            is_profile = head_direction in ["left_profile", "right_profile"]
+
+            return True, is_profile, int(face_area), int(eye_count), is_frontal
+
+        except Exception as e:
+            print(f"❌ Error in pose detection: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            return False, "unknown", 0, 0, False
 
-        print(f"🧠 Head Direction: {head_direction} (shift: {shift_ratio:.2f})")
 
-        # For API compatibility: convert to boolean is_profile
-        is_profile = head_direction in ["left_profile", "right_profile"]
+_default_engine = None
 
-        return True, is_profile, int(face_area), int(eye_count), is_frontal
 
-    except Exception as e:
-        print(f"❌ Error in pose detection: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        return False, "unknown", 0, 0, False
\ No newline at end of file
+def detect_head_pose(image_path, geometry: dict = None, crop_box: tuple = None, frame_size: tuple = None):
+    """HeadPoseEngine.detect on a shared engine sized by HEAD_POSE_THREADS (default: usable cores)."""
+    global _default_engine
+    if _default_engine is None:
+        _default_engine = HeadPoseEngine(threads=int(os.getenv("HEAD_POSE_THREADS", 0)))
+    return _default_engine.detect(image_path, geometry, crop_box, frame_size)
@@ -0,0 +1,193 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import List, Optional
+
+# Storage backends for AuditLog
+BACKEND_SQLITE = "sqlite"
+BACKEND_JSONL = "jsonl"
+
+
+class SqliteSink:
+    """Appends events to one SQLite database in WAL mode, shared by all workers."""
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30.0)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=FULL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS audit_events ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " ts REAL NOT NULL,"
+            " event TEXT NOT NULL,"
+            " session_id TEXT,"
+            " pid INTEGER NOT NULL,"
+            " data TEXT NOT NULL)"
+        )
+        self.conn.commit()
+
+    def write(self, events: List[dict]):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO audit_events (ts, event, session_id, pid, data) VALUES (?, ?, ?, ?, ?)",
+                [(e["ts"], e["event"], e["session_id"], e["pid"], json.dumps(e["data"])) for e in events],
+            )
+
+    def close(self):
+        self.conn.close()
+
+
+class JsonlSink:
+    """
+    Appends events as JSON lines to segment files, one writer per process.
+    A segment is closed once it reaches segment_bytes and never written again.
+    """
+
+    def __init__(self, directory: str, segment_bytes: int = 64 * 1024 * 1024):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.file = None
+
+    def _open_segment(self):
+        if self.file is not None:
+            self.file.close()
+        name = f"audit-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.jsonl"
+        self.file = open(os.path.join(self.directory, name), "ab")
+
+    def write(self, events: List[dict]):
+        if self.file is None or self.file.tell() >= self.segment_bytes:
+            self._open_segment()
+        self.file.write(b"".join(json.dumps(e, separators=(",", ":")).encode() + b"\n" for e in events))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class AuditLog:
+    """
+    Durable record of verification decisions, written off the request path.
+
+    record() only puts the event on a bounded in-memory queue; a background
+    thread drains whatever has accumulated and writes it as one batch (one
+    transaction, or one write + fsync). When the queue is full the event is
+    dropped and counted rather than blocking the request.
+
+    The writer thread is started on first use in each process, so the log can
+    be created before the launcher forks its workers.
+    """
+
+    def __init__(self, path: str, backend: str = BACKEND_SQLITE, max_queue: int = 10000, batch_size: int = 500):
+        if backend not in (BACKEND_SQLITE, BACKEND_JSONL):
+            raise ValueError(f"Unknown audit log backend: {backend}")
+        self.path = path
+        self.backend = backend
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._writer = None
+        self._stopping = threading.Event()
+
+        self.enqueued = 0
+        self.dropped = 0
+        self.flushed = 0
+        self.failed = 0
+        self.batches = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+
+    def _ensure_writer(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # Fresh queue and thread in a forked child; the parent's didn't survive the fork
+            self._queue = queue.Queue(maxsize=self.max_queue)
+            self._stopping = threading.Event()
+            self._writer = threading.Thread(target=self._run, name="audit-log", daemon=True)
+            self._writer.start()
+            self._pid = os.getpid()
+
+    def record(self, event: str, session_id: Optional[str] = None, **data) -> bool:
+        """Queue one event; returns False if it was dropped because the queue is full."""
+        self._ensure_writer()
+        entry = {"ts": time.time(), "event": event, "session_id": session_id, "pid": os.getpid(), "data": data}
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self.enqueued += 1
+        return True
+
+    def _open_sink(self):
+        if self.backend == BACKEND_SQLITE:
+            return SqliteSink(self.path)
+        return JsonlSink(self.path)
+
+    def _run(self):
+        sink = self._open_sink()
+        try:
+            while True:
+                try:
+                    batch = [self._queue.get(timeout=0.5)]
+                except queue.Empty:
+                    if self._stopping.is_set():
+                        return
+                    continue
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                self._flush(sink, batch)
+        finally:
+            sink.close()
+
+    def _flush(self, sink, batch: List[dict]):
+        started = time.time()
+        try:
+            sink.write(batch)
+        except Exception as e:
+            self.failed += len(batch)
+            print(f"❌ Audit log write of {len(batch)} events failed: {str(e)}")
+            return
+        elapsed_ms = (time.time() - started) * 1000
+        self.flushed += len(batch)
+        self.batches += 1
+        self.last_flush_ms = elapsed_ms
+        self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+
+    def close(self, timeout: float = 5.0):
+        """Write out everything still queued, waiting at most `timeout` seconds."""
+        if self._pid != os.getpid():
+            return
+        self._stopping.set()
+        self._writer.join(timeout)
+
+    def metrics(self) -> dict:
+        return {
+            "backend": self.backend,
+            "queue_depth": self._queue.qsize() if self._pid == os.getpid() else 0,
+            "max_queue": self.max_queue,
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "flushed": self.flushed,
+            "failed": self.failed,
+            "batches": self.batches,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "max_flush_ms": round(self.max_flush_ms, 2),
+        }
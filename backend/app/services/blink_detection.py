@@ -1,23 +1,30 @@
 import cv2
+from app.services.capture_hints import CROP_PADDING
+from app.services.image_utils import load_image, crop_to_frame, ThreadLocalCascade
+
+# Share of each side of a crop_region that is padding around the face
+CROP_FACE_INSET = CROP_PADDING / (1 + 2 * CROP_PADDING)
 
 class FaceBlinkDetector:
     def __init__(self):
-        # Load cascades once when the class is created
-        self.face_cascade = cv2.CascadeClassifier(
-            cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
-        )
-        self.eye_cascade = cv2.CascadeClassifier(
-            cv2.data.haarcascades + 'haarcascade_eye.xml'
-        )
-        print("✅ Haar cascades loaded successfully")
+        # Loaded once per thread on first use; detection runs off the event loop
+        self.face_cascade = ThreadLocalCascade('haarcascade_frontalface_default.xml')
+        self.eye_cascade = ThreadLocalCascade('haarcascade_eye.xml')
 
-    def detect_blink(self, image_path: str):
+    def detect_blink(self, image_path, geometry: dict = None, crop_box: tuple = None, frame_size: tuple = None):
         """
         Detect blinks using pre-loaded OpenCV Haar Cascades.
+        image_path may also be encoded bytes or a decoded BGR array.
+        If the image is a face crop (a capture hints crop_region), pass its
+        crop_box (x, y, w, h) and the original frame_size (w, h): face
+        detection is skipped, the face is taken to be the crop minus its
+        padding, and geometry is reported in frame coordinates.
+        If a geometry dict is passed, it is filled with "frame_size" (w, h) and
+        "face_box" (x, y, w, h) in original frame coordinates.
         Returns: (face_detected, eyes_open, left_ear, right_ear, num_eyes_detected)
         """
         try:
-            img = cv2.imread(image_path)
+            img = load_image(image_path)
             if img is None:
                 print("❌ Could not read image")
                 return False, True, 0.0, 0.0, 0
@@ -25,19 +32,31 @@ class FaceBlinkDetector:
             # Resize for faster processing
             max_dimension = 640
             h, w = img.shape[:2]
+            scale = 1.0
+            crop_shape = img.shape
+            if geometry is not None:
+                geometry["frame_size"] = tuple(frame_size) if crop_box else (int(w), int(h))
             if max(h, w) > max_dimension:
                 scale = max_dimension / max(h, w)
                 img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
 
             gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
 
-            # Detect face
-            faces = self.face_cascade.detectMultiScale(gray, 1.2, 4, minSize=(60, 60))
-            if len(faces) == 0:
-                print("❌ No face detected")
-                return False, True, 0.0, 0.0, 0
+            if crop_box:
+                # The client already cropped to the face; go straight to the eyes
+                crop_h, crop_w = gray.shape
+                x, y = int(crop_w * CROP_FACE_INSET), int(crop_h * CROP_FACE_INSET)
+                w, h = crop_w - 2 * x, crop_h - 2 * y
+            else:
+                faces = self.face_cascade.detectMultiScale(gray, 1.2, 4, minSize=(60, 60))
+                if len(faces) == 0:
+                    print("❌ No face detected")
+                    return False, True, 0.0, 0.0, 0
 
-            (x, y, w, h) = max(faces, key=lambda f: f[2] * f[3])
+                (x, y, w, h) = max(faces, key=lambda f: f[2] * f[3])
+            if geometry is not None:
+                face_box = tuple(int(round(v / scale)) for v in (x, y, w, h))
+                geometry["face_box"] = crop_to_frame(face_box, crop_shape, crop_box) if crop_box else face_box
             roi_gray = gray[y:int(y + h * 0.6), x:x+w]
             roi_enhanced = cv2.equalizeHist(roi_gray)
 
@@ -0,0 +1,120 @@
+from typing import Optional
+
+from app.services.qos import QoSController, TIER_FAST, TIER_CACHED
+
+# Challenge states reported by the liveness endpoints
+STATE_NO_FACE = "no_face"         # nothing to track yet
+STATE_TRACKING = "tracking"       # face found, waiting for the gesture
+STATE_TRANSITION = "transition"   # mid-gesture (e.g. eyes closed), next frame matters most
+STATE_COMPLETE = "complete"       # challenge done, stop sending frames
+
+# crop_region pads the face box by this fraction of its size on every side
+CROP_PADDING = 0.5
+
+
+class CaptureHintAdvisor:
+    """
+    Computes capture hints the client should apply to its next frame.
+
+    The interval stretches with server load and tightens while a gesture is in
+    progress. The target resolution is chosen so the detected face lands at
+    about `target_face_px` wide, which is all the cascades and ArcFace need;
+    the rest of the frame is wasted upload and decode work.
+    """
+
+    def __init__(
+        self,
+        qos: QoSController,
+        base_interval_ms: int = 500,
+        min_interval_ms: int = 250,
+        max_interval_ms: int = 2000,
+        target_face_px: int = 160,
+        min_long_side: int = 320,
+        max_long_side: int = 1280,
+        crop_padding: float = CROP_PADDING,
+    ):
+        self.qos = qos
+        self.base_interval_ms = base_interval_ms
+        self.min_interval_ms = min_interval_ms
+        self.max_interval_ms = max_interval_ms
+        self.target_face_px = target_face_px
+        self.min_long_side = min_long_side
+        self.max_long_side = max_long_side
+        self.crop_padding = crop_padding
+
+    def _load_factor(self) -> float:
+        queue_load = self.qos.in_flight / max(self.qos.fast_queue_depth, 1)
+        latency_load = self.qos.slowdown() / max(self.qos.fast_slowdown, 1e-6)
+        return max(1.0, queue_load, latency_load)
+
+    def next_interval_ms(self, challenge_state: str) -> Optional[int]:
+        if challenge_state == STATE_COMPLETE:
+            return None
+
+        interval = self.base_interval_ms * self._load_factor()
+        if challenge_state == STATE_TRANSITION:
+            interval /= 2
+        elif challenge_state == STATE_NO_FACE:
+            interval *= 1.5
+
+        return int(min(max(interval, self.min_interval_ms), self.max_interval_ms))
+
+    def jpeg_quality(self) -> float:
+        # Same 0-1 scale as expo-camera's takePictureAsync quality
+        tier = self.qos.current_tier
+        if tier == TIER_CACHED:
+            return 0.3
+        if tier == TIER_FAST:
+            return 0.4
+        return 0.5
+
+    def target_resolution(self, frame_size: Optional[tuple], face_box: Optional[tuple]) -> Optional[dict]:
+        if not frame_size or not face_box or face_box[2] <= 0:
+            return None
+
+        frame_w, frame_h = frame_size
+        long_side = max(frame_w, frame_h)
+        scale = self.target_face_px / face_box[2]
+        target_long = min(max(long_side * scale, self.min_long_side), self.max_long_side, long_side)
+        ratio = target_long / long_side
+
+        return {
+            "width": int(round(frame_w * ratio)),
+            "height": int(round(frame_h * ratio)),
+        }
+
+    def crop_region(self, frame_size: Optional[tuple], face_box: Optional[tuple]) -> Optional[dict]:
+        """
+        Padded face box in pixels of the frame it was found in, together with
+        that frame's size: the crop_* and frame_* parameters of the -roi
+        endpoints, as is. A client capturing at another resolution scales all
+        six values by the same factor.
+        """
+        if not frame_size or not face_box:
+            return None
+
+        frame_w, frame_h = frame_size
+        x, y, w, h = face_box
+        pad_w, pad_h = w * self.crop_padding, h * self.crop_padding
+        left = max(0.0, x - pad_w)
+        top = max(0.0, y - pad_h)
+        right = min(float(frame_w), x + w + pad_w)
+        bottom = min(float(frame_h), y + h + pad_h)
+
+        return {
+            "x": int(left),
+            "y": int(top),
+            "width": int(right) - int(left),
+            "height": int(bottom) - int(top),
+            "frame_width": int(frame_w),
+            "frame_height": int(frame_h),
+        }
+
+    def hints(self, challenge_state: str, frame_size: Optional[tuple] = None, face_box: Optional[tuple] = None) -> dict:
+        return {
+            "challenge_state": challenge_state,
+            "next_interval_ms": self.next_interval_ms(challenge_state),
+            "target_resolution": self.target_resolution(frame_size, face_box),
+            "jpeg_quality": self.jpeg_quality(),
+            "crop_region": self.crop_region(frame_size, face_box),
+        }
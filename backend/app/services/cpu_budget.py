@@ -0,0 +1,188 @@
+"""
+CPU core budget for OpenCV, TensorFlow and the app's own thread pools.
+
+Every library sizes its thread pool to the full machine by default, so N
+workers on a C-core box run roughly N * C * 3 busy threads. CpuBudget splits
+a total core budget evenly between workers and sizes every pool inside a
+worker to its share.
+
+    python -m app.services.cpu_budget --benchmark frame.jpg --cores 8 --workers 1,2,4,8
+"""
+import argparse
+import os
+import time
+from typing import List, Optional
+
+# Thread-count variables read by OpenMP, BLAS and TensorFlow at import time
+THREAD_ENV_VARS = (
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+    "TF_NUM_INTRAOP_THREADS",
+)
+
+
+class CpuBudget:
+    def __init__(self, total_cores: Optional[int] = None, workers: int = 1, pin: bool = False):
+        self.available = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+        self.total_cores = min(total_cores or len(self.available), len(self.available))
+        self.workers = max(1, workers)
+        self.pin = pin
+
+        self.cores_per_worker = max(1, self.total_cores // self.workers)
+        self.opencv_threads = self.cores_per_worker
+        self.tf_intra_op_threads = self.cores_per_worker
+        self.tf_inter_op_threads = 2 if self.cores_per_worker >= 4 else 1
+        # Verification jobs each run a TF graph that already uses the intra-op pool
+        self.verification_workers = max(1, self.cores_per_worker // 2)
+        # Shared by every head-turn request in the worker; scans beyond it run inline
+        self.head_pose_threads = self.cores_per_worker
+
+    @classmethod
+    def from_env(cls) -> Optional["CpuBudget"]:
+        """Budget from CPU_BUDGET_CORES / CPU_BUDGET_WORKERS / CPU_BUDGET_PIN, or None if unset."""
+        cores = os.getenv("CPU_BUDGET_CORES")
+        if not cores:
+            return None
+        return cls(
+            total_cores=int(cores),
+            workers=int(os.getenv("CPU_BUDGET_WORKERS", 1)),
+            pin=os.getenv("CPU_BUDGET_PIN", "0") == "1",
+        )
+
+    def cores_for(self, worker_index: int) -> List[int]:
+        """The block of cores worker `worker_index` is pinned to."""
+        start = (worker_index * self.cores_per_worker) % self.total_cores
+        return [self.available[(start + i) % self.total_cores] for i in range(self.cores_per_worker)]
+
+    def apply_env(self):
+        """
+        Export thread counts for libraries that only read them at import.
+        Call before numpy, cv2 or TensorFlow are imported.
+        """
+        for name in THREAD_ENV_VARS:
+            os.environ[name] = str(self.cores_per_worker)
+        os.environ["TF_NUM_INTEROP_THREADS"] = str(self.tf_inter_op_threads)
+        os.environ["VERIFICATION_WORKERS"] = str(self.verification_workers)
+        os.environ["HEAD_POSE_THREADS"] = str(self.head_pose_threads)
+
+    def apply(self, tensorflow: Optional[bool] = None):
+        """
+        Size the OpenCV and TensorFlow pools of this process. By default
+        TensorFlow is left alone (not even imported) when FACE_MODEL_SOCKET
+        is set, since inference then runs in the model server.
+        """
+        import cv2
+        cv2.setNumThreads(self.opencv_threads)
+
+        if tensorflow is None:
+            tensorflow = not os.getenv("FACE_MODEL_SOCKET")
+        if not tensorflow:
+            return
+        try:
+            import tensorflow as tf
+            tf.config.threading.set_intra_op_parallelism_threads(self.tf_intra_op_threads)
+            tf.config.threading.set_inter_op_parallelism_threads(self.tf_inter_op_threads)
+        except ImportError:
+            pass
+        except RuntimeError:
+            # TF is already initialised; the TF_NUM_*_THREADS env vars from
+            # apply_env() took effect instead, if they were set in time
+            print("⚠️ TensorFlow already initialised, thread pools not resized")
+
+    def pin_worker(self, worker_index: int):
+        """Pin this process to its block of cores, if pinning is enabled."""
+        if self.pin and hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, self.cores_for(worker_index))
+
+    def describe(self) -> dict:
+        return {
+            "total_cores": self.total_cores,
+            "workers": self.workers,
+            "cores_per_worker": self.cores_per_worker,
+            "opencv_threads": self.opencv_threads,
+            "tf_intra_op_threads": self.tf_intra_op_threads,
+            "tf_inter_op_threads": self.tf_inter_op_threads,
+            "verification_workers": self.verification_workers,
+            "head_pose_threads": self.head_pose_threads,
+            "pinned": self.pin,
+        }
+
+
+def _benchmark_worker(budget: CpuBudget, worker_index: int, image_path: str, seconds: float, verify: bool, results):
+    budget.apply_env()
+    budget.apply()
+    budget.pin_worker(worker_index)
+
+    import cv2
+    from app.services.anti_spoof import detect_head_pose
+    from app.services.blink_detection import FaceBlinkDetector
+
+    image = cv2.imread(image_path)
+    detector = FaceBlinkDetector()
+    face_service = None
+    if verify:
+        from app.services.face_recognition import FaceRecognitionService
+        face_service = FaceRecognitionService()
+        face_service.verify_against_id(image, image)  # warm-up
+
+    latencies = []
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        started = time.time()
+        detector.detect_blink(image)
+        detect_head_pose(image)
+        if face_service is not None:
+            face_service.verify_against_id(image, image)
+        latencies.append(time.time() - started)
+
+    results.put(latencies)
+
+
+def benchmark(image_path: str, total_cores: int, worker_counts: List[int], seconds: float, pin: bool, verify: bool):
+    """Run the liveness pipeline under each worker/thread allocation and report throughput."""
+    import multiprocessing
+
+    # Spawn, not fork, so every worker imports the libraries under its own budget
+    context = multiprocessing.get_context("spawn")
+    print(f"{'workers':>8} {'cores/w':>8} {'frames/s':>10} {'p50 ms':>8} {'p95 ms':>8}")
+
+    for workers in worker_counts:
+        budget = CpuBudget(total_cores, workers, pin)
+        results = context.Queue()
+        processes = [
+            context.Process(target=_benchmark_worker, args=(budget, index, image_path, seconds, verify, results))
+            for index in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        latencies = sorted(sum((results.get() for _ in processes), []))
+        for process in processes:
+            process.join()
+
+        if not latencies:
+            print(f"{workers:>8} {budget.cores_per_worker:>8} {'-':>10}")
+            continue
+        throughput = len(latencies) / seconds
+        p50 = latencies[len(latencies) // 2] * 1000
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000
+        print(f"{workers:>8} {budget.cores_per_worker:>8} {throughput:>10.1f} {p50:>8.1f} {p95:>8.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare pipeline throughput across CPU allocations")
+    parser.add_argument("--benchmark", metavar="IMAGE", required=True, help="Frame to run the pipeline on")
+    parser.add_argument("--cores", type=int, default=None, help="Total core budget (default: all)")
+    parser.add_argument("--workers", default="1,2,4", help="Comma-separated worker counts to try")
+    parser.add_argument("--seconds", type=float, default=10.0, help="Duration of each run")
+    parser.add_argument("--pin", action="store_true", help="Pin each worker to its own cores")
+    parser.add_argument("--verify", action="store_true", help="Include ArcFace verification in each iteration")
+    args = parser.parse_args(argv)
+
+    total = args.cores or CpuBudget().total_cores
+    benchmark(args.benchmark, total, [int(w) for w in args.workers.split(",")], args.seconds, args.pin, args.verify)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalize rows so a dot product is cosine similarity."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores per row, best first."""
+    k = min(k, scores.shape[-1])
+    if k <= 0:
+        return np.empty(scores.shape[:-1] + (0,), dtype=np.int64)
+    part = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+    order = np.argsort(-np.take_along_axis(scores, part, axis=-1), axis=-1)
+    return np.take_along_axis(part, order, axis=-1)
+
+
+class EmbeddingIndex:
+    """
+    1:N cosine-similarity search over applicant face embeddings.
+
+    Embeddings are kept normalized in one contiguous float32 matrix (grown by
+    doubling), so a query is a single matrix product. With `nlist` set, an
+    IVF-style coarse quantizer is trained once the index holds enough
+    vectors: each vector is assigned to its nearest centroid and a query only
+    scans the `nprobe` closest lists. Training runs on a background thread,
+    never inside add() or load(); searches scan every row until it is done.
+
+    Each id has at most one live row: adding an existing id or removing one
+    only marks the old row dead, and dead rows are skipped by searches until
+    the index is rebuilt with load().
+    """
+
+    def __init__(self, dim: int = 512, nlist: int = 0, nprobe: int = 8, train_min: int = 0, capacity: int = 1024):
+        self.dim = dim
+        self.nlist = nlist
+        self.nprobe = nprobe
+        # Train the quantizer only once there are enough points per list
+        self.train_min = train_min or nlist * 39
+        self._lock = threading.RLock()
+        self._vectors = np.empty((capacity, dim), dtype=np.float32)
+        self._count = 0
+        self.ids: List[str] = []
+        self.centroids: Optional[np.ndarray] = None
+        self._assignments = np.empty(capacity, dtype=np.int32)
+        self._lists: List[np.ndarray] = []
+        self._alive = np.zeros(capacity, dtype=bool)
+        self._positions: Dict[str, int] = {}
+        self._dead = 0
+        # Bumped by load(), so a training run over replaced rows is discarded
+        self._epoch = 0
+        self._trainer: Optional[threading.Thread] = None
+
+    @classmethod
+    def from_matrix(cls, ids: List[str], matrix: np.ndarray, **kwargs) -> "EmbeddingIndex":
+        """
+        Build an index over an existing matrix of normalized embeddings, such
+        as a memory-mapped EmbeddingStore file. The matrix is used in place; it
+        is only copied into private memory on the first add().
+        """
+        index = cls(dim=matrix.shape[1], capacity=1, **kwargs)
+        index.load(ids, matrix)
+        return index
+
+    def load(self, ids: List[str], matrix: np.ndarray, train: bool = True):
+        """
+        Replace the contents with an existing matrix, in place and without a
+        copy (see from_matrix). Dead rows and the quantizer are dropped; it is
+        retrained in the background if `train` and there are enough vectors.
+        """
+        with self._lock:
+            self._vectors = matrix
+            self._count = len(matrix)
+            self._assignments = np.empty(len(matrix), dtype=np.int32)
+            self._alive = np.ones(len(matrix), dtype=bool)
+            self.ids = list(ids)
+            self._positions = {key: i for i, key in enumerate(self.ids)}
+            self._dead = 0
+            self.centroids = None
+            self._lists = []
+            self._epoch += 1
+            self._trainer = None
+            if train:
+                self._start_training()
+
+    def __len__(self) -> int:
+        return self._count - self._dead
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._positions
+
+    @property
+    def vectors(self) -> np.ndarray:
+        return self._vectors[:self._count]
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    def _grow(self, needed: int):
+        capacity = self._vectors.shape[0]
+        if needed <= capacity and self._vectors.flags.writeable:
+            return
+        capacity = max(capacity, 1)
+        while capacity < needed:
+            capacity *= 2
+        vectors = np.empty((capacity, self.dim), dtype=np.float32)
+        vectors[:self._count] = self._vectors[:self._count]
+        self._vectors = vectors
+        assignments = np.empty(capacity, dtype=np.int32)
+        assignments[:self._count] = self._assignments[:self._count]
+        self._assignments = assignments
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:self._count] = self._alive[:self._count]
+        self._alive = alive
+
+    def add(self, ids: List[str], embeddings: np.ndarray):
+        """Add rows; an id that is already present is replaced."""
+        embeddings = normalize(np.atleast_2d(embeddings))
+        if embeddings.shape[1] != self.dim:
+            raise ValueError(f"Expected {self.dim}-d embeddings, got {embeddings.shape[1]}-d")
+
+        with self._lock:
+            start = self._count
+            self._grow(start + len(embeddings))
+            self._vectors[start:start + len(embeddings)] = embeddings
+            self._count += len(embeddings)
+            self.ids.extend(ids)
+            self._alive[start:self._count] = True
+            for offset, key in enumerate(ids):
+                self._kill(key)
+                self._positions[key] = start + offset
+
+            if self.trained:
+                assigned = self._assign(embeddings)
+                self._assignments[start:self._count] = assigned
+                if len(embeddings) > 1024:
+                    self._rebuild_lists()
+                else:
+                    for offset, centroid in enumerate(assigned):
+                        self._lists[centroid] = np.append(self._lists[centroid], start + offset)
+            else:
+                self._start_training()
+
+    def remove(self, ids: List[str]):
+        with self._lock:
+            for key in ids:
+                self._kill(key)
+                self._positions.pop(key, None)
+
+    def _kill(self, key: str):
+        position = self._positions.get(key)
+        if position is not None:
+            self._alive[position] = False
+            self._dead += 1
+
+    def _start_training(self):
+        """Train on a background thread once there are enough vectors (caller holds the lock)."""
+        if not self.nlist or self.trained or self._count < self.train_min:
+            return
+        if self._trainer is not None and self._trainer.is_alive():
+            return
+        self._trainer = threading.Thread(target=self.train, name="embedding-index-train", daemon=True)
+        self._trainer.start()
+
+    def wait_for_training(self, timeout: float = None) -> bool:
+        """Block until a background training run finishes; returns whether the index is trained."""
+        trainer = self._trainer
+        if trainer is not None:
+            trainer.join(timeout)
+        return self.trained
+
+    def train(self, iterations: int = 20, seed: int = 0):
+        """
+        Fit the coarse quantizer with spherical k-means over the stored
+        vectors. k-means runs on a snapshot without holding the lock, so
+        searches and adds carry on meanwhile; rows added during the run are
+        assigned when the centroids are installed.
+        """
+        with self._lock:
+            data = self.vectors
+            epoch = self._epoch
+        if len(data) < self.nlist:
+            return
+
+        rng = np.random.default_rng(seed)
+        centroids = data[rng.choice(len(data), self.nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assigned = np.argmax(data @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assigned, data)
+            counts = np.bincount(assigned, minlength=self.nlist)
+            empty = counts == 0
+            # Re-seed empty lists with random points
+            sums[empty] = data[rng.choice(len(data), int(empty.sum()))]
+            centroids = normalize(sums)
+        assigned = np.argmax(data @ centroids.T, axis=1).astype(np.int32)
+
+        with self._lock:
+            if self._epoch != epoch:
+                # load() replaced the rows while we were training
+                return
+            self.centroids = centroids
+            self._assignments[:len(data)] = assigned
+            if self._count > len(data):
+                self._assignments[len(data):self._count] = self._assign(self._vectors[len(data):self._count])
+            self._rebuild_lists()
+            print(f"✅ Embedding index quantizer trained: {self.nlist} lists over {self._count} vectors")
+
+    def _assign(self, embeddings: np.ndarray) -> np.ndarray:
+        return np.argmax(embeddings @ self.centroids.T, axis=1).astype(np.int32)
+
+    def _rebuild_lists(self):
+        assignments = self._assignments[:self._count]
+        order = np.argsort(assignments, kind="stable")
+        bounds = np.searchsorted(assignments[order], np.arange(self.nlist + 1))
+        self._lists = [order[bounds[i]:bounds[i + 1]] for i in range(self.nlist)]
+
+    def search(self, queries: np.ndarray, k: int = 5) -> List[List[tuple]]:
+        """
+        Top-k neighbours for each query row.
+        Returns one list per query of (id, cosine_similarity), best first.
+        """
+        queries = normalize(np.atleast_2d(queries))
+        with self._lock:
+            if self._count == 0:
+                return [[] for _ in range(len(queries))]
+            if self.trained:
+                return [self._search_ivf(query, k) for query in queries]
+
+            scores = queries @ self.vectors.T
+            if self._dead:
+                scores[:, ~self._alive[:self._count]] = -np.inf
+            best = top_k(scores, min(k, len(self)))
+            return [
+                [(self.ids[i], float(scores[row, i])) for i in best[row]]
+                for row in range(len(queries))
+            ]
+
+    def _search_ivf(self, query: np.ndarray, k: int) -> List[tuple]:
+        probes = top_k((self.centroids @ query)[None, :], self.nprobe)[0]
+        candidates = np.concatenate([self._lists[p] for p in probes])
+        candidates = candidates[self._alive[candidates]]
+        if len(candidates) == 0:
+            return []
+        scores = self._vectors[candidates] @ query
+        best = top_k(scores[None, :], k)[0]
+        return [(self.ids[candidates[i]], float(scores[i])) for i in best]
@@ -0,0 +1,337 @@
+import fcntl
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+OP_PUT = 1
+OP_DELETE = 2
+
+KEY_BYTES = 64
+
+# One append-log entry; the embedding and crop live in column files at `slot`
+LOG_DTYPE = np.dtype([
+    ("op", np.uint8),
+    ("key", f"S{KEY_BYTES}"),
+    ("slot", np.uint32),
+    ("has_crop", np.uint8),
+    ("created_at", np.float64),
+])
+
+
+class StoreChanges(NamedTuple):
+    """
+    What refresh() picked up. With reset the store was reopened (e.g. after
+    a compaction) and anything built from it must be rebuilt from live().
+    """
+    reset: bool
+    put: List[str]       # new or overwritten keys
+    deleted: List[str]
+
+
+class EmbeddingStore:
+    """
+    Persistent, memory-mapped store of ID embeddings and optional face crops.
+
+    Data lives in a directory as fixed-size records split into column files:
+
+        CURRENT                 generation number of the live files
+        log.<gen>               append log of (op, key, slot, has_crop, created_at)
+        embeddings.<gen>.f32    slot-major float32 rows, L2-normalized
+        crops.<gen>.u8          slot-major crop_size x crop_size x 3 BGR rows
+
+    Writes append the embedding and crop first and the log record last, so a
+    crash never leaves a log entry pointing at a missing row. Appends take an
+    flock on the log so several workers can share one store. Readers map the
+    files read-only; the embedding matrix is used in place, shared through the
+    page cache rather than copied into each worker.
+
+    Deletes append a tombstone. compact() rewrites the live rows into a new
+    generation and switches CURRENT atomically; processes that still map the
+    old generation keep reading it until they reopen.
+
+    Within a process, writes and refreshes are serialised by a lock, so two
+    threads never replay the same log records or take the same changes.
+    """
+
+    def __init__(self, directory: str, dim: int = 512, crop_size: int = 112):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.dim = dim
+        self.crop_size = crop_size
+        self.embedding_bytes = dim * 4
+        self.crop_bytes = crop_size * crop_size * 3
+
+        self.generation = None
+        self._log = None
+        self._embeddings = None
+        self._crops = None
+        self._log_count = 0
+        self.slots: Dict[str, int] = {}
+        self.crop_keys = set()
+        self.dead_slots = 0
+        self._pending: Dict[str, int] = {}
+        # Reentrant: put() and compact() refresh or reopen while holding it
+        self.lock = threading.RLock()
+        self.open()
+        # Consumers build from live() right after construction
+        self._reopened = False
+        self._pending = {}
+
+    # --- paths -----------------------------------------------------------
+
+    def _current_generation(self) -> int:
+        current = self.directory / "CURRENT"
+        if not current.exists():
+            return 0
+        return int(current.read_text().strip() or 0)
+
+    def _paths(self, generation: int) -> tuple:
+        return (
+            self.directory / f"log.{generation}",
+            self.directory / f"embeddings.{generation}.f32",
+            self.directory / f"crops.{generation}.u8",
+        )
+
+    @contextmanager
+    def _locked(self):
+        with open(self.directory / "LOCK", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    # --- reading ---------------------------------------------------------
+
+    @staticmethod
+    def _map(path: Path, dtype, row_shape: tuple = ()):
+        size = path.stat().st_size if path.exists() else 0
+        itemsize = np.dtype(dtype).itemsize * int(np.prod(row_shape or (1,)))
+        rows = size // itemsize
+        if rows == 0:
+            return np.empty((0,) + row_shape, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode="r", shape=(rows,) + row_shape)
+
+    def open(self):
+        """(Re)map the current generation and replay its log."""
+        with self.lock:
+            self._open()
+
+    def _open(self):
+        self.generation = self._current_generation()
+        self._log = None
+        self._log_count = 0
+        self.slots = {}
+        self.crop_keys = set()
+        self.dead_slots = 0
+        # A reopen supersedes individual changes: consumers rebuild from live()
+        self._pending = {}
+        self._reopened = True
+        self._replay()
+
+    def refresh(self) -> StoreChanges:
+        """
+        Pick up records appended (or a compaction done) by this or other
+        processes since the last call.
+        """
+        with self.lock:
+            self._catch_up()
+            pending, self._pending = self._pending, {}
+            reset, self._reopened = self._reopened, False
+        return StoreChanges(
+            reset,
+            [key for key, op in pending.items() if op == OP_PUT],
+            [key for key, op in pending.items() if op == OP_DELETE],
+        )
+
+    def _catch_up(self):
+        with self.lock:
+            if self._current_generation() != self.generation:
+                self._open()
+            self._replay()
+
+    def _replay(self):
+        """Apply new log records, noting each key's last op for the next refresh()."""
+        log_path, embeddings_path, crops_path = self._paths(self.generation)
+        log_size = log_path.stat().st_size if log_path.exists() else 0
+        if self._log is not None and log_size // LOG_DTYPE.itemsize == self._log_count:
+            return
+
+        self._log = self._map(log_path, LOG_DTYPE)
+        self._embeddings = self._map(embeddings_path, np.float32, (self.dim,))
+        self._crops = self._map(crops_path, np.uint8, (self.crop_size, self.crop_size, 3))
+
+        for record in self._log[self._log_count:]:
+            key = record["key"].decode()
+            if key in self.slots:
+                self.dead_slots += 1
+            self.crop_keys.discard(key)
+            if record["op"] == OP_PUT:
+                self.slots[key] = int(record["slot"])
+                if record["has_crop"]:
+                    self.crop_keys.add(key)
+            else:
+                self.slots.pop(key, None)
+            self._pending.pop(key, None)
+            self._pending[key] = int(record["op"])
+        self._log_count = len(self._log)
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.slots
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        slot = self.slots.get(key)
+        return None if slot is None else self._embeddings[slot]
+
+    def get_crop(self, key: str) -> Optional[np.ndarray]:
+        if key not in self.crop_keys:
+            return None
+        return self._crops[self.slots[key]]
+
+    def live(self) -> tuple:
+        """
+        (keys, embedding matrix) of every live record. When nothing has been
+        deleted or overwritten the matrix is the mapped file itself, no copy.
+        """
+        keys = list(self.slots)
+        if self.dead_slots == 0 and len(keys) == len(self._embeddings):
+            order = np.argsort([self.slots[k] for k in keys])
+            return [keys[i] for i in order], self._embeddings
+        return keys, np.asarray(self._embeddings[[self.slots[k] for k in keys]])
+
+    # --- writing ---------------------------------------------------------
+
+    def put(self, key: str, embedding: np.ndarray, crop: Optional[np.ndarray] = None) -> StoreChanges:
+        """
+        Append a record. Returns the changes picked up by the refresh that
+        follows, which include this one and any made by other processes.
+        """
+        if len(key.encode()) > KEY_BYTES:
+            raise ValueError(f"Key longer than {KEY_BYTES} bytes: {key}")
+
+        embedding = np.asarray(embedding, dtype=np.float32).reshape(self.dim)
+        norm = np.linalg.norm(embedding)
+        if norm > 0:
+            embedding = embedding / norm
+
+        crop_row = np.zeros((self.crop_size, self.crop_size, 3), dtype=np.uint8)
+        if crop is not None:
+            crop_row[:] = crop
+
+        with self.lock, self._locked():
+            if self._current_generation() != self.generation:
+                self._open()
+            log_path, embeddings_path, crops_path = self._paths(self.generation)
+
+            # Rows are written at their slot offset, so a torn write from a
+            # crash before the log record is simply overwritten next time
+            slot = (embeddings_path.stat().st_size if embeddings_path.exists() else 0) // self.embedding_bytes
+            self._write_row(embeddings_path, slot * self.embedding_bytes, embedding.tobytes())
+            self._write_row(crops_path, slot * self.crop_bytes, crop_row.tobytes())
+            self._append_log(log_path, OP_PUT, key, slot, crop is not None)
+            return self.refresh()
+
+    def delete(self, key: str) -> Optional[StoreChanges]:
+        """Append a tombstone. Returns the changes picked up by the refresh that follows."""
+        with self.lock, self._locked():
+            if self._current_generation() != self.generation:
+                self._open()
+            if key not in self.slots:
+                return None
+            log_path, _, _ = self._paths(self.generation)
+            self._append_log(log_path, OP_DELETE, key, 0, False)
+            return self.refresh()
+
+    @staticmethod
+    def _write_row(path: Path, offset: int, data: bytes):
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT, 0o644)
+        try:
+            os.pwrite(fd, data, offset)
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def _append_log(log_path: Path, op: int, key: str, slot: int, has_crop: bool):
+        record = np.zeros(1, dtype=LOG_DTYPE)
+        record["op"] = op
+        record["key"] = key.encode()
+        record["slot"] = slot
+        record["has_crop"] = has_crop
+        record["created_at"] = time.time()
+        with open(log_path, "ab") as f:
+            f.write(record.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+    def compact_if_needed(self, dead_ratio: float = 0.5) -> bool:
+        """Compact when tombstoned or overwritten rows exceed dead_ratio of all rows."""
+        with self.lock, self._locked():
+            self._catch_up()
+            total = len(self.slots) + self.dead_slots
+            if total == 0 or self.dead_slots / total <= dead_ratio:
+                return False
+        self.compact()
+        return True
+
+    def compact(self):
+        """Rewrite live records into a new generation and drop the old files."""
+        with self.lock, self._locked():
+            self._catch_up()
+            old_generation = self.generation
+            new_generation = old_generation + 1
+            log_path, embeddings_path, crops_path = self._paths(new_generation)
+
+            keys = sorted(self.slots, key=lambda k: self.slots[k])
+            old_slots = [self.slots[k] for k in keys]
+            log = np.zeros(len(keys), dtype=LOG_DTYPE)
+            log["op"] = OP_PUT
+            log["key"] = [k.encode() for k in keys]
+            log["slot"] = np.arange(len(keys), dtype=np.uint32)
+            log["has_crop"] = [k in self.crop_keys for k in keys]
+            log["created_at"] = time.time()
+
+            crops = np.asarray(self._crops[old_slots], dtype=np.uint8)
+
+            for path, data in (
+                (embeddings_path, np.asarray(self._embeddings[old_slots], dtype=np.float32)),
+                (crops_path, crops),
+                (log_path, log),
+            ):
+                with open(path, "wb") as f:
+                    f.write(data.tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+
+            current_tmp = self.directory / "CURRENT.tmp"
+            current_tmp.write_text(str(new_generation))
+            os.replace(current_tmp, self.directory / "CURRENT")
+
+            for path in self._paths(old_generation):
+                if path.exists():
+                    path.unlink()
+
+            self._open()
+            print(f"✅ Embedding store compacted: {len(keys)} live records (generation {new_generation})")
+
+
+def apply_changes(index, store: EmbeddingStore, changes: StoreChanges):
+    """
+    Bring an EmbeddingIndex built from store.live() up to date with the
+    changes of a refresh: rebuilt after a reopen, otherwise tombstones
+    removed and new or overwritten keys (re)added.
+    """
+    if changes.reset:
+        index.load(*store.live())
+        return
+    index.remove(changes.deleted)
+    keys = [key for key in changes.put if key in store]
+    if keys:
+        index.add(keys, np.stack([store.get(key) for key in keys]))
@@ -1,28 +1,34 @@
-from ast import Dict
-import time
-import os
-from deepface import DeepFace
+import cv2
+import numpy as np
+
+from app.services.image_utils import ThreadLocalCascade
+
+# deepface (and TensorFlow) is imported inside the methods that need it, so
+# liveness-only processes that talk to a model server never load it
+
+# DeepFace's default cosine threshold for ArcFace
+ARCFACE_COSINE_THRESHOLD = 0.68
 
-# blink_sessions: Dict[str, dict] = {}
 
 class FaceRecognitionService:
-    def __init__(self):
-        pass
+    def __init__(self, model_name: str = "ArcFace"):
+        self.model_name = model_name
+        # crop_face runs on verification and request pool threads at once
+        self.face_cascade = ThreadLocalCascade('haarcascade_frontalface_default.xml')
 
-    def verify_against_id(live_image_path: str, id_path: str) -> tuple:
+    def verify_against_id(self, live_image, id_image, detector_backend: str = "mtcnn") -> tuple:
         """
         Verify if the person in the live image matches the ID.
         Returns: (is_match, distance, threshold, error_message)
         """
-     
-
         try:
+            from deepface import DeepFace
             result = DeepFace.verify(
-                img1_path=id_path,
-                img2_path=live_image_path,
-                model_name="ArcFace",
+                img1_path=id_image,
+                img2_path=live_image,
+                model_name=self.model_name,
                 enforce_detection=True,
-                detector_backend="mtcnn"
+                detector_backend=detector_backend
             )
 
             verified = result["verified"]
@@ -30,14 +36,117 @@ class FaceRecognitionService:
             threshold = result["threshold"]
 
             print(
-                f"  🔍 ID Verification: {'✅ MATCH' if verified else '❌ NO MATCH'} "
+                f"  🔍 ID Verification ({detector_backend}): {'✅ MATCH' if verified else '❌ NO MATCH'} "
                 f"- Distance: {distance:.4f}, Threshold: {threshold:.4f}"
             )
 
             return verified, distance, threshold, None
 
         except Exception as e:
-            error_msg = str(e).lower()
             print(f"  ❌ ID Verification Error: {str(e)}")
             return False, None, None, str(e)
 
+    def represent(self, image, detector_backend: str = "mtcnn") -> np.ndarray:
+        """
+        Compute the embedding of the largest face in an image.
+        Raises ValueError when no face can be detected.
+        """
+        embedding, _ = self.represent_face(image, detector_backend)
+        return embedding
+
+    def represent_face(self, image, detector_backend: str = "mtcnn") -> tuple:
+        """
+        Same as represent, but also returns the detected facial area.
+        Returns: (embedding, (x, y, w, h))
+        """
+        from deepface import DeepFace
+        result = DeepFace.represent(
+            img_path=image,
+            model_name=self.model_name,
+            enforce_detection=True,
+            detector_backend=detector_backend
+        )
+        area = result[0].get("facial_area", {})
+        box = (area.get("x", 0), area.get("y", 0), area.get("w", 0), area.get("h", 0))
+        return np.asarray(result[0]["embedding"], dtype=np.float32), box
+
+    def crop_face(self, image):
+        """
+        Crop the largest frontal face with the Haar cascade.
+        Returns the BGR crop, or None when no face is found.
+        """
+        img = cv2.imread(image) if isinstance(image, str) else image
+        if img is None:
+            return None
+
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        faces = self.face_cascade.detectMultiScale(gray, 1.2, 4, minSize=(60, 60))
+        if len(faces) == 0:
+            return None
+
+        (x, y, w, h) = max(faces, key=lambda f: f[2] * f[3])
+        return img[y:y + h, x:x + w]
+
+    def verify_with_embedding(self, live_image, id_embedding: np.ndarray, detector_backend: str = "skip") -> tuple:
+        """
+        Compare a live image against a precomputed ID embedding.
+        With detector_backend "skip" the live face is cropped with the Haar
+        cascade and embedded without running a second detector, so the only
+        model cost is one ArcFace pass.
+        Returns: (is_match, distance, threshold, error_message)
+        """
+        verified, distances, threshold, error = self.verify_with_references(
+            live_image, np.asarray(id_embedding)[None, :], detector_backend
+        )
+        return verified, float(distances[0]) if distances is not None else None, threshold, error
+
+    def verify_with_references(self, live_image, references: np.ndarray, detector_backend: str = "skip") -> tuple:
+        """
+        Compare a live image against several reference embeddings (one per
+        row) at once. The live face is embedded once and all distances come
+        from one matrix product. The match is decided by the ID in row 0
+        alone; the other rows only corroborate it and are reported per row.
+        With detector_backend "skip" the face is Haar-cropped first, as in
+        verify_with_embedding.
+        Returns: (is_match, distances, threshold, error_message)
+        """
+        try:
+            if detector_backend == "skip":
+                live_image = self.crop_face(live_image)
+                if live_image is None:
+                    return False, None, None, "Face could not be detected in live image"
+
+            live_embedding = self.represent(live_image, detector_backend=detector_backend)
+            distances = cosine_distances(references, live_embedding)
+            threshold = ARCFACE_COSINE_THRESHOLD
+            verified = bool(distances[0] <= threshold)
+
+            print(
+                f"  🔍 ID Verification ({detector_backend}, {len(distances)} refs): {'✅ MATCH' if verified else '❌ NO MATCH'} "
+                f"- ID distance: {distances[0]:.4f}, Threshold: {threshold:.4f}"
+            )
+
+            return verified, distances, threshold, None
+
+        except Exception as e:
+            print(f"  ❌ ID Verification Error: {str(e)}")
+            return False, None, None, str(e)
+
+
+def cosine_distance(a: np.ndarray, b: np.ndarray) -> float:
+    """Cosine distance between two embedding vectors."""
+    a = np.asarray(a, dtype=np.float32)
+    b = np.asarray(b, dtype=np.float32)
+    denom = float(np.linalg.norm(a) * np.linalg.norm(b))
+    if denom == 0.0:
+        return 1.0
+    return 1.0 - float(np.dot(a, b)) / denom
+
+
+def cosine_distances(matrix: np.ndarray, vector: np.ndarray) -> np.ndarray:
+    """Cosine distance from every row of matrix to vector."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    vector = np.asarray(vector, dtype=np.float32)
+    denom = np.linalg.norm(matrix, axis=1) * np.linalg.norm(vector)
+    similarity = np.divide(matrix @ vector, denom, out=np.zeros(len(matrix), dtype=np.float32), where=denom > 0)
+    return 1.0 - similarity
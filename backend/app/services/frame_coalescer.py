@@ -0,0 +1,66 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Dict, Set
+
+
+class FrameSuperseded(Exception):
+    """Raised when a newer frame for the same stream arrived while this one waited."""
+
+
+class FrameCoalescer:
+    """
+    Keeps at most one frame per stream waiting behind the one being processed.
+
+    A stream is identified by a key such as (session_id, "blink"). A frame
+    that arrives while its stream is busy waits on a future; a newer frame
+    fails that future with FrameSuperseded straight away and takes its place,
+    so the dropped request is answered as soon as it is replaced, not when
+    the running frame finishes. When the running frame finishes it hands the
+    stream to the waiting one, if any.
+    """
+
+    def __init__(self):
+        self._running: Set[tuple] = set()
+        self._waiting: Dict[tuple, asyncio.Future] = {}
+        self.superseded_count = 0
+
+    @asynccontextmanager
+    async def slot(self, key: tuple):
+        previous = self._waiting.pop(key, None)
+        if previous is not None and not previous.done():
+            self.superseded_count += 1
+            previous.set_exception(FrameSuperseded())
+
+        if key in self._running:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiting[key] = waiter
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if self._waiting.get(key) is waiter:
+                    del self._waiting[key]
+                elif waiter.done() and not waiter.cancelled() and waiter.exception() is None:
+                    # The stream was handed to us just before the cancel; pass it on
+                    self._release(key)
+                raise
+        else:
+            self._running.add(key)
+
+        try:
+            yield
+        finally:
+            self._release(key)
+
+    def _release(self, key: tuple):
+        """Hand the stream to its waiting frame, or forget it so finished sessions don't accumulate."""
+        waiter = self._waiting.pop(key, None)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+        else:
+            self._running.discard(key)
+
+    def forget_session(self, session_id: str):
+        for key in [k for k in self._waiting if k[0] == session_id]:
+            waiter = self._waiting.pop(key)
+            if not waiter.done():
+                waiter.set_exception(FrameSuperseded())
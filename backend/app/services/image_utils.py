@@ -0,0 +1,52 @@
+import threading
+
+import cv2
+import numpy as np
+
+
+class ThreadLocalCascade:
+    """
+    Haar cascade loaded once per thread. CascadeClassifier isn't thread-safe,
+    and detectors run on the request thread pool and the verification pool.
+    Attribute access (detectMultiScale etc.) goes to this thread's copy.
+    """
+
+    def __init__(self, filename: str):
+        self.path = cv2.data.haarcascades + filename
+        self._local = threading.local()
+
+    def __getattr__(self, name):
+        cascade = getattr(self._local, "cascade", None)
+        if cascade is None:
+            cascade = cv2.CascadeClassifier(self.path)
+            self._local.cascade = cascade
+        return getattr(cascade, name)
+
+
+def load_image(source):
+    """Return a BGR image from a file path, encoded bytes or an already decoded array."""
+    if isinstance(source, np.ndarray):
+        return source
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return cv2.imdecode(np.frombuffer(source, dtype=np.uint8), cv2.IMREAD_COLOR)
+    return cv2.imread(source)
+
+
+def crop_to_frame(box, crop_shape, crop_box) -> tuple:
+    """
+    Map an (x, y, w, h) box found inside a face crop back to full-frame coordinates.
+
+    crop_box is the (x, y, w, h) of the crop in the original frame. The crop may
+    have been resized by the client before upload, so the decoded crop shape is
+    used to recover the scale.
+    """
+    crop_h, crop_w = crop_shape[:2]
+    scale_x = crop_box[2] / crop_w if crop_w else 1.0
+    scale_y = crop_box[3] / crop_h if crop_h else 1.0
+    x, y, w, h = box
+    return (
+        int(round(crop_box[0] + x * scale_x)),
+        int(round(crop_box[1] + y * scale_y)),
+        int(round(w * scale_x)),
+        int(round(h * scale_y)),
+    )
@@ -0,0 +1,204 @@
+import json
+import os
+import socket
+import struct
+import threading
+from contextlib import ExitStack
+
+import cv2
+import numpy as np
+
+from app.services.face_recognition import FaceRecognitionService
+from app.services.shared_frames import FrameHandle, SharedFramePool, attach
+
+DEFAULT_SOCKET = "/tmp/tuloan-models.sock"
+
+# Wire format, both directions:
+#   4-byte big-endian header length, JSON header, then the raw bytes of every
+#   array listed in header["arrays"] in order. Array arguments are replaced in
+#   the header by {"__array__": i}; frames already placed in shared memory
+#   travel as {"__frame__": [name, shape, dtype]} with no payload bytes.
+HEADER_LENGTH = struct.Struct(">I")
+
+# Smaller arrays (embeddings, face crops) are cheaper to send inline
+SHARE_MIN_BYTES = 64 * 1024
+
+
+def _encode(value, arrays: list):
+    if isinstance(value, FrameHandle):
+        return {"__frame__": [value.name, list(value.shape), value.dtype]}
+    if isinstance(value, np.ndarray):
+        arrays.append(np.ascontiguousarray(value))
+        return {"__array__": len(arrays) - 1}
+    if isinstance(value, (list, tuple)):
+        return [_encode(v, arrays) for v in value]
+    if isinstance(value, dict):
+        return {k: _encode(v, arrays) for k, v in value.items()}
+    if isinstance(value, (np.floating, np.integer, np.bool_)):
+        return value.item()
+    return value
+
+
+def _decode(value, arrays: list):
+    if isinstance(value, dict):
+        if "__array__" in value:
+            return arrays[value["__array__"]]
+        if "__frame__" in value:
+            return attach(FrameHandle(*value["__frame__"]))
+        return {k: _decode(v, arrays) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_decode(v, arrays) for v in value]
+    return value
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytearray:
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        n = sock.recv_into(view[received:], size - received)
+        if n == 0:
+            raise ConnectionError("Model server closed the connection")
+        received += n
+    return buffer
+
+
+def send_message(sock: socket.socket, message: dict):
+    arrays = []
+    payload = _encode(message, arrays)
+    header = json.dumps({
+        "payload": payload,
+        "arrays": [{"dtype": a.dtype.str, "shape": a.shape} for a in arrays],
+    }).encode()
+    sock.sendall(HEADER_LENGTH.pack(len(header)) + header)
+    for array in arrays:
+        sock.sendall(memoryview(array).cast("B"))
+
+
+def recv_message(sock: socket.socket) -> dict:
+    (length,) = HEADER_LENGTH.unpack(_recv_exact(sock, HEADER_LENGTH.size))
+    header = json.loads(_recv_exact(sock, length))
+    arrays = []
+    for spec in header["arrays"]:
+        dtype = np.dtype(spec["dtype"])
+        shape = tuple(spec["shape"])
+        nbytes = int(np.prod(shape)) * dtype.itemsize
+        arrays.append(np.frombuffer(_recv_exact(sock, nbytes), dtype=dtype).reshape(shape))
+    return _decode(header["payload"], arrays)
+
+
+class RemoteFaceRecognitionService(FaceRecognitionService):
+    """
+    FaceRecognitionService whose DeepFace calls run in a model server process
+    (app.model_server) reached over a Unix socket.
+
+    The Haar crop for the cached tier still runs locally, so only the small
+    face crop crosses the socket. Each thread keeps its own connection.
+    With frame_slots > 0, full frames are handed over through a pool of
+    shared-memory slabs instead of being streamed through the socket.
+    """
+
+    def __init__(self, socket_path: str = DEFAULT_SOCKET, model_name: str = "ArcFace", timeout: float = 30.0, frame_slots: int = 0):
+        super().__init__(model_name)
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.frame_slots = frame_slots
+        self._local = threading.local()
+        self._pool = None
+        self._pool_pid = None
+        self._pool_lock = threading.Lock()
+
+    def _frame_pool(self):
+        """The slab pool of this process; forked workers create their own."""
+        if not self.frame_slots:
+            return None
+        with self._pool_lock:
+            if self._pool_pid != os.getpid():
+                self._pool = SharedFramePool(self.frame_slots)
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    def _share(self, value, stack: ExitStack):
+        if not isinstance(value, np.ndarray) or value.nbytes < SHARE_MIN_BYTES:
+            return value
+        pool = self._frame_pool()
+        if pool is None:
+            return value
+        handle = stack.enter_context(pool.lease(value))
+        return value if handle is None else handle
+
+    def _connection(self) -> socket.socket:
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+            self._local.sock = sock
+        return sock
+
+    def _close(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is not None:
+            sock.close()
+            self._local.sock = None
+
+    def call(self, op: str, **kwargs):
+        """Send one request; retried once on a fresh connection if the old one broke."""
+        with ExitStack() as stack:
+            # Slabs stay leased until the server has answered
+            kwargs = {key: self._share(value, stack) for key, value in kwargs.items()}
+            for attempt in range(2):
+                try:
+                    sock = self._connection()
+                    send_message(sock, {"op": op, "args": kwargs})
+                    response = recv_message(sock)
+                    break
+                except (ConnectionError, BrokenPipeError, socket.timeout, OSError):
+                    self._close()
+                    if attempt == 1:
+                        raise
+
+        if not response.get("ok"):
+            error = response.get("error", "Model server error")
+            if response.get("error_type") == "ValueError":
+                raise ValueError(error)
+            raise RuntimeError(error)
+        return response["result"]
+
+    def verify_against_id(self, live_image, id_image, detector_backend: str = "mtcnn") -> tuple:
+        try:
+            # The server runs in another cwd (or container), so paths are read here
+            live_image, id_image = self._load(live_image), self._load(id_image)
+            result = self.call("verify", live_image=live_image, id_image=id_image, detector_backend=detector_backend)
+            return tuple(result)
+        except Exception as e:
+            print(f"  ❌ Model server error: {str(e)}")
+            return False, None, None, str(e)
+
+    def represent_face(self, image, detector_backend: str = "mtcnn") -> tuple:
+        embedding, box = self.call("represent_face", image=self._load(image), detector_backend=detector_backend)
+        return np.asarray(embedding, dtype=np.float32), tuple(box)
+
+    @staticmethod
+    def _load(image):
+        """Image paths are resolved in this process and sent as arrays."""
+        if not isinstance(image, str):
+            return image
+        array = cv2.imread(image)
+        if array is None:
+            raise ValueError(f"Could not read image {image}")
+        return array
+
+    def ping(self, timeout: float = 1.0) -> bool:
+        """
+        Liveness probe on its own short-lived connection, so it never waits
+        behind a request in flight nor for the full request timeout.
+        """
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.settimeout(timeout)
+                sock.connect(self.socket_path)
+                send_message(sock, {"op": "ping", "args": {}})
+                return recv_message(sock).get("result") == "pong"
+        except Exception:
+            return False
@@ -0,0 +1,150 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+# Quality-of-service tiers for ID verification, best quality first
+TIER_FULL = "full"        # DeepFace.verify with the MTCNN detector
+TIER_FAST = "fast"        # DeepFace.verify with the OpenCV Haar detector
+TIER_CACHED = "cached"    # Haar crop of the live frame vs cached ID embedding
+
+TIERS = (TIER_FULL, TIER_FAST, TIER_CACHED)
+
+DETECTOR_BACKENDS = {
+    TIER_FULL: "mtcnn",
+    TIER_FAST: "opencv",
+    TIER_CACHED: "opencv",
+}
+
+
+class QoSController:
+    """
+    Picks a verification tier from the current load.
+
+    Load is measured as the number of requests in flight in this worker and
+    the slowdown of recent verifications: each tier's latency EWMA divided by
+    that tier's own baseline (the lowest EWMA it has shown, drifting slowly
+    upwards). A host where an idle MTCNN verify takes seconds therefore runs
+    at slowdown 1.0 and stays on the full tier; only contention degrades it.
+    A slowdown not refreshed for `stale_after` seconds no longer counts.
+
+    Degrading happens immediately; recovering to a better tier requires the
+    load to stay below the threshold for `recover_after` seconds so the tier
+    does not flap at the boundary.
+    """
+
+    def __init__(
+        self,
+        fast_queue_depth: int = 4,
+        cached_queue_depth: int = 8,
+        fast_slowdown: float = 2.0,
+        cached_slowdown: float = 3.0,
+        smoothing: float = 0.3,
+        baseline_drift: float = 0.01,
+        recover_after: float = 10.0,
+        stale_after: float = 30.0,
+        clock=time.monotonic,
+    ):
+        self.fast_queue_depth = fast_queue_depth
+        self.cached_queue_depth = cached_queue_depth
+        self.fast_slowdown = fast_slowdown
+        self.cached_slowdown = cached_slowdown
+        self.smoothing = smoothing
+        self.baseline_drift = baseline_drift
+        self.recover_after = recover_after
+        self.stale_after = stale_after
+        self.clock = clock
+
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.latency_ewma = 0.0
+        self._slowdown = 1.0
+        self._recorded_at = None
+        self.current_tier = TIER_FULL
+        self._tier_since = clock()
+        self.decisions: Dict[str, int] = {tier: 0 for tier in TIERS}
+        self.tier_latency: Dict[str, float] = {tier: 0.0 for tier in TIERS}
+        self.tier_baseline: Dict[str, float] = {tier: 0.0 for tier in TIERS}
+
+    @contextmanager
+    def track_request(self):
+        """Count a request as in flight for the duration of the block."""
+        with self._lock:
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def slowdown(self) -> float:
+        """Latency of recent verifications relative to their tier's baseline; 1.0 when idle."""
+        if self._recorded_at is None or self.clock() - self._recorded_at > self.stale_after:
+            return 1.0
+        return self._slowdown
+
+    def _target_tier(self) -> str:
+        slowdown = self.slowdown()
+        if self.in_flight >= self.cached_queue_depth or slowdown >= self.cached_slowdown:
+            return TIER_CACHED
+        if self.in_flight >= self.fast_queue_depth or slowdown >= self.fast_slowdown:
+            return TIER_FAST
+        return TIER_FULL
+
+    def select_tier(self, cached_available: bool = True) -> str:
+        """Return the tier the next verification should run at."""
+        with self._lock:
+            target = self._target_tier()
+            now = self.clock()
+
+            if TIERS.index(target) > TIERS.index(self.current_tier):
+                self.current_tier = target
+                self._tier_since = now
+            elif TIERS.index(target) < TIERS.index(self.current_tier) and now - self._tier_since >= self.recover_after:
+                # Recover one tier at a time
+                self.current_tier = TIERS[TIERS.index(self.current_tier) - 1]
+                self._tier_since = now
+            elif target == self.current_tier:
+                # Still loaded: the recovery wait starts over once load drops
+                self._tier_since = now
+
+            tier = self.current_tier
+
+        if tier == TIER_CACHED and not cached_available:
+            return TIER_FAST
+        return tier
+
+    def record(self, tier: str, latency: float):
+        """Feed back the latency of a verification run at `tier`."""
+        with self._lock:
+            self.decisions[tier] += 1
+            if self.latency_ewma == 0.0:
+                self.latency_ewma = latency
+            else:
+                self.latency_ewma += self.smoothing * (latency - self.latency_ewma)
+
+            previous = self.tier_latency[tier]
+            ewma = latency if previous == 0.0 else previous + self.smoothing * (latency - previous)
+            self.tier_latency[tier] = ewma
+
+            baseline = self.tier_baseline[tier]
+            if baseline == 0.0 or ewma < baseline:
+                baseline = ewma
+            else:
+                baseline += self.baseline_drift * (ewma - baseline)
+            self.tier_baseline[tier] = baseline
+
+            self._slowdown = ewma / baseline if baseline > 0 else 1.0
+            self._recorded_at = self.clock()
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "current_tier": self.current_tier,
+                "in_flight": self.in_flight,
+                "latency_ewma": round(self.latency_ewma, 4),
+                "slowdown": round(self.slowdown(), 3),
+                "decisions": dict(self.decisions),
+                "tier_latency_ewma": {tier: round(value, 4) for tier, value in self.tier_latency.items()},
+                "tier_baseline": {tier: round(value, 4) for tier, value in self.tier_baseline.items()},
+            }
@@ -0,0 +1,153 @@
+import atexit
+import os
+import secrets
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+from typing import List, NamedTuple, Optional
+
+import numpy as np
+
+from app.services.upload_reader import MAX_IMAGE_DIMENSION
+
+# Large enough for any decoded frame after upload_reader's size cap
+DEFAULT_SLOT_BYTES = MAX_IMAGE_DIMENSION * MAX_IMAGE_DIMENSION * 3
+
+# Segments a receiving process keeps mapped; older ones are closed
+MAX_ATTACHED = int(os.getenv("MAX_ATTACHED_FRAME_SEGMENTS", 64))
+
+
+class FrameHandle(NamedTuple):
+    """What crosses the process boundary instead of the pixels."""
+    name: str
+    shape: tuple
+    dtype: str
+
+
+class SharedFramePool:
+    """
+    Fixed pool of reusable shared-memory slabs for handing decoded frames to
+    other processes without pickling them.
+
+    A frame is copied into a free slab once; the receiver maps the same slab
+    by name and reads it in place. Slabs are created up front and reused, so
+    there is no per-frame allocation on either side. The creating process
+    owns the segments and unlinks them at exit.
+
+    Slab names carry a random nonce as well as the pid, so a restarted
+    worker that gets a recycled pid never reuses a name a receiver may
+    still have mapped.
+    """
+
+    def __init__(self, slots: int = 8, slot_bytes: int = DEFAULT_SLOT_BYTES):
+        self.slot_bytes = slot_bytes
+        self.owner_pid = os.getpid()
+        self.prefix = f"tuloan_{self.owner_pid}_{secrets.token_hex(4)}"
+        self._segments = [
+            shared_memory.SharedMemory(create=True, size=slot_bytes, name=f"{self.prefix}_{i}")
+            for i in range(slots)
+        ]
+        self._free = list(range(slots))
+        self._available = threading.Condition()
+        atexit.register(self.close)
+
+    def acquire(self, timeout: Optional[float] = None) -> Optional[int]:
+        """Reserve a slab; returns None if none frees up within timeout."""
+        with self._available:
+            if not self._available.wait_for(lambda: self._free, timeout=timeout):
+                return None
+            return self._free.pop()
+
+    def release(self, slot: int):
+        with self._available:
+            self._free.append(slot)
+            self._available.notify()
+
+    def write(self, slot: int, frame: np.ndarray) -> FrameHandle:
+        if frame.nbytes > self.slot_bytes:
+            raise ValueError(f"Frame of {frame.nbytes} bytes does not fit a {self.slot_bytes}-byte slab")
+        segment = self._segments[slot]
+        view = np.ndarray(frame.shape, dtype=frame.dtype, buffer=segment.buf)
+        view[...] = frame
+        return FrameHandle(segment.name, tuple(frame.shape), frame.dtype.str)
+
+    @contextmanager
+    def lease(self, frame: np.ndarray, timeout: Optional[float] = 0.0):
+        """
+        Copy a frame into a slab for the duration of the block.
+        Yields None when the frame doesn't fit or no slab is free, so callers
+        can fall back to sending the bytes.
+        """
+        slot = self.acquire(timeout) if frame.nbytes <= self.slot_bytes else None
+        if slot is None:
+            yield None
+            return
+        try:
+            yield self.write(slot, frame)
+        finally:
+            self.release(slot)
+
+    def close(self):
+        if os.getpid() != self.owner_pid:
+            return
+        for segment in self._segments:
+            try:
+                segment.close()
+                segment.unlink()
+            except (FileNotFoundError, BufferError):
+                pass
+        self._segments = []
+
+
+# Segments attached by this (receiving) process, by name, least recently used first.
+# An unlinked segment's pages are only freed once every mapping is closed, so
+# the cache is bounded: segments of senders that have exited age out.
+_attached: "OrderedDict[str, shared_memory.SharedMemory]" = OrderedDict()
+# Evicted segments whose buffer was still in use; closed on a later eviction
+_retired: List[shared_memory.SharedMemory] = []
+_attached_lock = threading.Lock()
+
+
+def _open_segment(name: str) -> shared_memory.SharedMemory:
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 always registers with the resource tracker, which
+        # would unlink the owner's segment when this process exits
+        from multiprocessing import resource_tracker
+        segment = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(segment._name, "shared_memory")
+        return segment
+
+
+def _detach(segment: shared_memory.SharedMemory):
+    """Close a mapping, or retire it if a frame view still points into it (caller holds the lock)."""
+    _retired.append(segment)
+    for retired in list(_retired):
+        try:
+            retired.close()
+        except BufferError:
+            continue
+        _retired.remove(retired)
+
+
+def attach(handle: FrameHandle) -> np.ndarray:
+    """Zero-copy view of a frame written by another process."""
+    dtype = np.dtype(handle.dtype)
+    nbytes = int(np.prod(handle.shape)) * dtype.itemsize
+    with _attached_lock:
+        segment = _attached.pop(handle.name, None)
+        if segment is not None and segment.size < nbytes:
+            # Not the segment we mapped under this name any more
+            _detach(segment)
+            segment = None
+        if segment is None:
+            segment = _open_segment(handle.name)
+            if segment.size < nbytes:
+                _detach(segment)
+                raise ValueError(f"Shared frame {handle.name} is smaller than a {nbytes}-byte frame")
+        _attached[handle.name] = segment
+        while len(_attached) > MAX_ATTACHED:
+            _detach(_attached.popitem(last=False)[1])
+    return np.ndarray(tuple(handle.shape), dtype=dtype, buffer=segment.buf)
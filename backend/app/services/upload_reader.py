@@ -0,0 +1,183 @@
+import os
+import struct
+
+import cv2
+import numpy as np
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", 8 * 1024 * 1024))
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", 40_000_000))
+MAX_IMAGE_DIMENSION = int(os.getenv("MAX_IMAGE_DIMENSION", 1280))
+# Whole request body: one upload plus the multipart envelope and form fields
+MAX_REQUEST_BYTES = int(os.getenv("MAX_REQUEST_BYTES", MAX_UPLOAD_BYTES + 64 * 1024))
+CHUNK_SIZE = 64 * 1024
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+JPEG_SOI = b"\xff\xd8\xff"
+
+# SOFn markers carry the frame size; C4 (DHT), C8 (JPG) and CC (DAC) don't
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+# Reduced-size decode flags, largest reduction first
+REDUCED_DECODE_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+
+class UploadRejected(Exception):
+    """Raised when an upload is too large, not an image, or can't be decoded."""
+
+
+class RequestSizeLimit:
+    """
+    ASGI middleware rejecting oversized request bodies with 413 before the
+    form is parsed. Starlette spools a multipart upload to a temp file before
+    the endpoint runs, so read_upload's limit alone comes too late.
+
+    A declared Content-Length over the limit is refused without reading the
+    body; chunked bodies are counted as they arrive and cut off once they
+    pass it.
+    """
+
+    def __init__(self, app, max_bytes: int = MAX_REQUEST_BYTES):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        declared = dict(scope["headers"]).get(b"content-length")
+        if declared is not None and (not declared.isdigit() or int(declared) > self.max_bytes):
+            response = JSONResponse({"detail": f"Request too large (max {self.max_bytes} bytes)"}, status_code=413)
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def receive_limited():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise HTTPException(status_code=413, detail=f"Request too large (max {self.max_bytes} bytes)")
+            return message
+
+        await self.app(scope, receive_limited, send)
+
+
+def sniff_format(header: bytes) -> str:
+    if header.startswith(JPEG_SOI):
+        return "jpeg"
+    if header.startswith(PNG_SIGNATURE):
+        return "png"
+    raise UploadRejected("Unsupported image format. Please upload a JPEG or PNG image.")
+
+
+def image_dimensions(content: bytes, image_format: str) -> tuple:
+    """
+    Read (width, height) from the image header without decoding pixels.
+    """
+    if image_format == "png":
+        if len(content) < 24 or content[12:16] != b"IHDR":
+            raise UploadRejected("Corrupt PNG header")
+        width, height = struct.unpack(">II", content[16:24])
+        return width, height
+
+    # Walk JPEG segments until the first start-of-frame marker
+    pos = 2
+    size = len(content)
+    while pos + 4 <= size:
+        if content[pos] != 0xFF:
+            raise UploadRejected("Corrupt JPEG header")
+        marker = content[pos + 1]
+        if marker == 0xFF:
+            pos += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            pos += 2
+            continue
+
+        segment_length = struct.unpack(">H", content[pos + 2:pos + 4])[0]
+        if marker in JPEG_SOF_MARKERS:
+            if pos + 9 > size:
+                break
+            height, width = struct.unpack(">HH", content[pos + 5:pos + 9])
+            return width, height
+        pos += 2 + segment_length
+
+    raise UploadRejected("Could not find JPEG frame size")
+
+
+async def read_upload(file: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES) -> tuple:
+    """
+    Read an upload in chunks, rejecting it as soon as it exceeds max_bytes or
+    its first bytes don't look like a JPEG or PNG.
+    Returns: (content, image_format, (width, height))
+    """
+    declared_size = getattr(file, "size", None)
+    if declared_size is not None and declared_size > max_bytes:
+        raise UploadRejected(f"Image too large: {declared_size} bytes (max {max_bytes})")
+
+    buffer = bytearray()
+    image_format = None
+
+    while True:
+        chunk = await file.read(CHUNK_SIZE)
+        if not chunk:
+            break
+
+        buffer += chunk
+        if len(buffer) > max_bytes:
+            raise UploadRejected(f"Image too large: more than {max_bytes} bytes")
+
+        if image_format is None and len(buffer) >= 8:
+            image_format = sniff_format(bytes(buffer[:8]))
+
+    if image_format is None:
+        raise UploadRejected("Empty or truncated upload")
+
+    content = bytes(buffer)
+    width, height = image_dimensions(content, image_format)
+    if width == 0 or height == 0:
+        raise UploadRejected("Image has no pixels")
+    if width * height > MAX_IMAGE_PIXELS:
+        raise UploadRejected(f"Image too large: {width}x{height} pixels")
+
+    return content, image_format, (width, height)
+
+
+def decode_image(content: bytes, dimensions: tuple, max_dimension: int = MAX_IMAGE_DIMENSION):
+    """
+    Decode to BGR with the long side capped at max_dimension.
+    JPEGs are decoded at a reduced DCT scale when possible, so a 12 MP
+    frame never materialises at full size.
+    """
+    long_side = max(dimensions)
+    flag = cv2.IMREAD_COLOR
+    for factor, reduced_flag in REDUCED_DECODE_FLAGS:
+        if long_side // factor >= max_dimension:
+            flag = reduced_flag
+            break
+
+    img = cv2.imdecode(np.frombuffer(content, dtype=np.uint8), flag)
+    if img is None:
+        raise UploadRejected("Could not decode image")
+
+    h, w = img.shape[:2]
+    if max(h, w) > max_dimension:
+        scale = max_dimension / max(h, w)
+        img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+    return img
+
+
+async def read_image(file: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES, max_dimension: int = MAX_IMAGE_DIMENSION):
+    """Stream, validate and decode an uploaded image in one step."""
+    content, _, dimensions = await read_upload(file, max_bytes)
+    return decode_image(content, dimensions, max_dimension)
@@ -0,0 +1,82 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict
+
+# Outcomes of VerificationJobQueue.submit
+JOB_SUBMITTED = "submitted"
+JOB_DUPLICATE = "duplicate"   # the session already has a job in flight
+JOB_BUSY = "busy"             # the queue is full, try again on a later frame
+
+
+class VerificationJobQueue:
+    """
+    Runs ID verifications in a bounded background pool so frame requests
+    don't block on DeepFace.
+
+    At most one job per session is in flight; at most `max_pending` jobs are
+    queued or running overall. The job function is responsible for storing
+    its result (normally in the liveness session).
+    """
+
+    def __init__(self, max_workers: int = 2, max_pending: int = 16):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="verify")
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Future] = {}
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def submit(self, session_id: str, fn: Callable, *args) -> str:
+        with self._lock:
+            running = self._jobs.get(session_id)
+            if running is not None and not running.done():
+                return JOB_DUPLICATE
+            if len(self._jobs) >= self.max_pending:
+                self.rejected += 1
+                return JOB_BUSY
+
+            future = self._executor.submit(fn, *args)
+            self._jobs[session_id] = future
+
+        future.add_done_callback(lambda f: self._finished(session_id, f))
+        return JOB_SUBMITTED
+
+    def _finished(self, session_id: str, future: Future):
+        with self._lock:
+            if self._jobs.get(session_id) is future:
+                del self._jobs[session_id]
+            if future.cancelled():
+                return
+            if future.exception() is not None:
+                self.failed += 1
+                print(f"❌ Verification job for session {session_id} crashed: {future.exception()}")
+            else:
+                self.completed += 1
+
+    def is_pending(self, session_id: str) -> bool:
+        with self._lock:
+            job = self._jobs.get(session_id)
+            return job is not None and not job.done()
+
+    def discard(self, session_id: str):
+        """Cancel a session's job if it hasn't started yet."""
+        with self._lock:
+            job = self._jobs.pop(session_id, None)
+        if job is not None:
+            job.cancel()
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "pending": len(self._jobs),
+                "max_pending": self.max_pending,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+            }
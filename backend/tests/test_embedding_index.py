@@ -0,0 +1,76 @@
+import numpy as np
+
+from app.services.embedding_index import EmbeddingIndex, normalize
+
+DIM = 16
+
+
+def vectors(n: int, seed: int = 0) -> np.ndarray:
+    return normalize(np.random.default_rng(seed).normal(size=(n, DIM)))
+
+
+def test_search_returns_nearest_first():
+    data = vectors(50)
+    index = EmbeddingIndex(dim=DIM)
+    index.add([f"p{i}" for i in range(50)], data)
+
+    matches = index.search(data[7], k=3)[0]
+    assert matches[0][0] == "p7"
+    assert matches[0][1] > 0.999
+    assert [s for _, s in matches] == sorted((s for _, s in matches), reverse=True)
+
+
+def test_readding_an_id_replaces_it():
+    data = vectors(3)
+    index = EmbeddingIndex(dim=DIM)
+    index.add(["a", "b"], data[:2])
+    index.add(["a"], data[2:])
+
+    assert len(index) == 2
+    matches = index.search(data[2], k=5)[0]
+    assert [m[0] for m in matches].count("a") == 1
+    assert matches[0][0] == "a"
+
+
+def test_removed_ids_are_not_returned():
+    data = vectors(4)
+    index = EmbeddingIndex.from_matrix(["a", "b", "c", "d"], data)
+    index.remove(["a"])
+
+    assert len(index) == 3
+    assert "a" not in index
+    assert "a" not in [m[0] for m in index.search(data[0], k=4)[0]]
+
+
+def test_ivf_search_skips_removed_rows():
+    data = vectors(200, seed=1)
+    index = EmbeddingIndex(dim=DIM, nlist=4, nprobe=4, train_min=100)
+    index.add([f"p{i}" for i in range(200)], data)
+    assert index.wait_for_training(timeout=10)
+
+    index.remove(["p5"])
+    index.add(["p6"], data[5:6])
+    ids = [m[0] for m in index.search(data[5], k=3)[0]]
+    assert "p5" not in ids
+    assert ids[0] == "p6"
+
+
+def test_load_rebuilds_in_place():
+    index = EmbeddingIndex.from_matrix(["a", "b"], vectors(2))
+    index.remove(["a"])
+    index.load(["c", "d", "e"], vectors(3, seed=2))
+
+    assert len(index) == 3
+    assert "a" not in index and "c" in index
+
+
+def test_training_runs_off_the_add_path():
+    data = vectors(200, seed=3)
+    index = EmbeddingIndex(dim=DIM, nlist=4, nprobe=1, train_min=100)
+    index.add([f"p{i}" for i in range(200)], data)
+
+    # Exact results while the quantizer trains, probed ones after
+    assert index.search(data[42], k=1)[0][0][0] == "p42"
+    assert index.wait_for_training(timeout=10)
+    index.add(["late"], data[42:43])
+    assert {m[0] for m in index.search(data[42], k=2)[0]} == {"p42", "late"}
@@ -0,0 +1,111 @@
+import threading
+
+import numpy as np
+
+from app.services.embedding_index import EmbeddingIndex
+from app.services.embedding_store import EmbeddingStore, apply_changes
+
+DIM = 8
+
+
+def vector(seed: int) -> np.ndarray:
+    return np.random.default_rng(seed).normal(size=DIM).astype(np.float32)
+
+
+def store_at(path) -> EmbeddingStore:
+    return EmbeddingStore(str(path), dim=DIM, crop_size=4)
+
+
+def test_replay_restores_puts_overwrites_and_deletes(tmp_path):
+    store = store_at(tmp_path)
+    for i in range(3):
+        store.put(f"a{i}", vector(i))
+    store.put("a1", vector(10))
+    store.delete("a2")
+
+    reopened = store_at(tmp_path)
+    assert sorted(reopened.slots) == ["a0", "a1"]
+    assert reopened.dead_slots == 2
+    np.testing.assert_allclose(reopened.get("a1"), vector(10) / np.linalg.norm(vector(10)), rtol=1e-6)
+
+
+def test_refresh_reports_changes_from_another_process(tmp_path):
+    writer, reader = store_at(tmp_path), store_at(tmp_path)
+    writer.put("a0", vector(0))
+    writer.put("a1", vector(1))
+    writer.delete("a0")
+
+    changes = reader.refresh()
+    assert not changes.reset
+    assert changes.put == ["a1"]
+    assert changes.deleted == ["a0"]
+    assert reader.refresh() == (False, [], [])
+
+
+def test_compaction_elsewhere_resets_readers(tmp_path):
+    writer, reader = store_at(tmp_path), store_at(tmp_path)
+    for i in range(4):
+        writer.put(f"a{i}", vector(i))
+    reader.refresh()
+    writer.delete("a0")
+    writer.compact()
+
+    changes = reader.refresh()
+    assert changes.reset
+    assert reader.generation == writer.generation == 1
+    assert sorted(reader.slots) == ["a1", "a2", "a3"]
+    assert reader.dead_slots == 0
+
+
+def test_internal_catch_up_does_not_swallow_changes(tmp_path):
+    writer, reader = store_at(tmp_path), store_at(tmp_path)
+    writer.put("a0", vector(0))
+    assert not reader.compact_if_needed()
+    assert reader.refresh().put == ["a0"]
+
+
+def test_index_stays_in_sync_through_delete_overwrite_and_compaction(tmp_path):
+    store, other_worker = store_at(tmp_path), store_at(tmp_path)
+    for i in range(4):
+        store.put(f"a{i}", vector(i))
+    index = EmbeddingIndex.from_matrix(*store.live())
+
+    apply_changes(index, store, store.delete("a0"))
+    apply_changes(index, store, store.put("a1", vector(11)))
+    assert len(index) == 3
+
+    other_worker.refresh()
+    other_worker.compact()
+    apply_changes(index, store, store.refresh())
+    apply_changes(index, store, store.put("a4", vector(4)))
+
+    assert len(index) == len(store) == 4
+    ids = [match_id for match_id, _ in index.search(vector(0), k=10)[0]]
+    assert sorted(ids) == ["a1", "a2", "a3", "a4"]
+    best_id, similarity = index.search(vector(11), k=1)[0][0]
+    assert best_id == "a1" and similarity > 0.999
+
+
+def test_concurrent_puts_and_refreshes_are_counted_once(tmp_path):
+    store = store_at(tmp_path)
+    index = EmbeddingIndex.from_matrix(*store.live())
+
+    def sync(write=None):
+        with store.lock:
+            apply_changes(index, store, write() if write else store.refresh())
+
+    def writer(offset: int):
+        for i in range(20):
+            # Every key is written twice, so each thread leaves 20 dead slots
+            sync(lambda: store.put(f"k{i % 10}-{offset}", vector(offset * 100 + i)))
+            sync()
+
+    threads = [threading.Thread(target=writer, args=(t,)) for t in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(store) == len(index) == 40
+    assert store.dead_slots == 40
+    assert store.refresh() == (False, [], [])
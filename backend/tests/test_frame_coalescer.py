@@ -0,0 +1,85 @@
+import asyncio
+import time
+
+from app.services.frame_coalescer import FrameCoalescer, FrameSuperseded
+
+
+async def handle(coalescer: FrameCoalescer, key: tuple, frame: int, work_seconds: float = 0.05):
+    """Same shape as the liveness endpoints: detection runs off the event loop inside the slot."""
+    try:
+        async with coalescer.slot(key):
+            await asyncio.to_thread(time.sleep, work_seconds)
+            return frame
+    except FrameSuperseded:
+        return None
+
+
+def test_frames_queued_behind_a_running_one_are_dropped_except_the_newest():
+    coalescer = FrameCoalescer()
+
+    async def run():
+        return await asyncio.gather(*(handle(coalescer, ("s1", "blink"), i) for i in range(4)))
+
+    assert asyncio.run(run()) == [0, None, None, 3]
+    assert coalescer.superseded_count == 2
+
+
+def test_streams_are_coalesced_independently():
+    coalescer = FrameCoalescer()
+
+    async def run():
+        return await asyncio.gather(
+            handle(coalescer, ("s1", "blink"), 0),
+            handle(coalescer, ("s2", "blink"), 1),
+            handle(coalescer, ("s1", "head_turn_left"), 2),
+        )
+
+    assert asyncio.run(run()) == [0, 1, 2]
+    assert coalescer.superseded_count == 0
+
+
+def test_finished_streams_are_forgotten():
+    coalescer = FrameCoalescer()
+
+    async def run():
+        await handle(coalescer, ("s1", "blink"), 0, work_seconds=0)
+        await handle(coalescer, ("s1", "blink"), 1, work_seconds=0)
+
+    asyncio.run(run())
+    assert coalescer.superseded_count == 0
+    assert not coalescer._running and not coalescer._waiting
+
+
+def test_superseded_frame_is_answered_when_replaced_not_when_the_running_one_ends():
+    coalescer = FrameCoalescer()
+    key = ("s1", "blink")
+
+    async def timed(frame: int, delay: float):
+        await asyncio.sleep(delay)
+        result = await handle(coalescer, key, frame, work_seconds=0.6)
+        return result, time.monotonic() - started
+
+    async def run():
+        return await asyncio.gather(timed(0, 0), timed(1, 0.05), timed(2, 0.2))
+
+    started = time.monotonic()
+    (first, _), (second, answered_at), (third, _) = asyncio.run(run())
+    assert (first, second, third) == (0, None, 2)
+    assert answered_at < 0.4
+
+
+def test_cancelled_waiter_does_not_block_the_stream():
+    coalescer = FrameCoalescer()
+    key = ("s1", "blink")
+
+    async def run():
+        running = asyncio.ensure_future(handle(coalescer, key, 0, work_seconds=0.1))
+        await asyncio.sleep(0.01)
+        waiting = asyncio.ensure_future(handle(coalescer, key, 1))
+        await asyncio.sleep(0.01)
+        waiting.cancel()
+        await asyncio.gather(running, waiting, return_exceptions=True)
+        return await handle(coalescer, key, 2, work_seconds=0)
+
+    assert asyncio.run(run()) == 2
+    assert not coalescer._running and not coalescer._waiting
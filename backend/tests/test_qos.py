@@ -0,0 +1,71 @@
+from app.services.qos import QoSController, TIER_CACHED, TIER_FAST, TIER_FULL
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def controller(**kwargs) -> tuple:
+    clock = FakeClock()
+    return QoSController(clock=clock, **kwargs), clock
+
+
+def test_slow_but_idle_host_stays_on_the_full_tier():
+    qos, clock = controller()
+    for _ in range(20):
+        qos.record(TIER_FULL, 2.5)
+        clock.now += 1
+        assert qos.select_tier() == TIER_FULL
+
+
+def test_queue_depth_degrades_immediately():
+    qos, _ = controller(fast_queue_depth=2, cached_queue_depth=4)
+    with qos.track_request(), qos.track_request():
+        assert qos.select_tier() == TIER_FAST
+        with qos.track_request(), qos.track_request():
+            assert qos.select_tier() == TIER_CACHED
+            assert qos.select_tier(cached_available=False) == TIER_FAST
+
+
+def test_slowdown_against_the_tier_baseline_degrades():
+    qos, _ = controller(smoothing=1.0)
+    qos.record(TIER_FULL, 1.0)
+    qos.record(TIER_FULL, 2.5)
+    assert qos.select_tier() == TIER_FAST
+    qos.record(TIER_FULL, 3.5)
+    assert qos.select_tier() == TIER_CACHED
+
+
+def test_recovery_waits_for_sustained_low_load_one_tier_at_a_time():
+    qos, clock = controller(cached_queue_depth=2, recover_after=10)
+    with qos.track_request(), qos.track_request():
+        assert qos.select_tier() == TIER_CACHED
+
+    clock.now += 5
+    assert qos.select_tier() == TIER_CACHED
+    # A new spike before the wait is over restarts it
+    with qos.track_request(), qos.track_request():
+        assert qos.select_tier() == TIER_CACHED
+    clock.now += 9
+    assert qos.select_tier() == TIER_CACHED
+    clock.now += 1
+    assert qos.select_tier() == TIER_FAST
+    assert qos.select_tier() == TIER_FAST
+    clock.now += 10
+    assert qos.select_tier() == TIER_FULL
+
+
+def test_stale_slowdown_does_not_hold_a_degraded_tier():
+    qos, clock = controller(smoothing=1.0, recover_after=10, stale_after=30)
+    qos.record(TIER_FULL, 1.0)
+    qos.record(TIER_FULL, 4.0)
+    assert qos.select_tier() == TIER_CACHED
+
+    clock.now += 31
+    assert qos.select_tier() == TIER_FAST
+    clock.now += 10
+    assert qos.select_tier() == TIER_FULL
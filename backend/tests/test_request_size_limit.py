@@ -0,0 +1,53 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("cv2")
+pytest.importorskip("fastapi")
+
+from fastapi import HTTPException
+
+from app.services.upload_reader import RequestSizeLimit
+
+
+async def echo_body(scope, receive, send):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            break
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": body})
+
+
+def call(app, headers: list, chunks: list) -> list:
+    messages = [{"type": "http.request", "body": chunk, "more_body": i < len(chunks) - 1} for i, chunk in enumerate(chunks)]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "POST", "path": "/", "headers": headers}
+    asyncio.run(app(scope, receive, send))
+    return sent
+
+
+def test_declared_length_over_the_limit_is_refused_unread():
+    sent = call(RequestSizeLimit(echo_body, max_bytes=10), [(b"content-length", b"11")], [b"x" * 11])
+    assert sent[0]["status"] == 413
+
+
+def test_body_within_the_limit_passes():
+    sent = call(RequestSizeLimit(echo_body, max_bytes=10), [(b"content-length", b"10")], [b"x" * 10])
+    assert sent[0]["status"] == 200
+    assert sent[1]["body"] == b"x" * 10
+
+
+def test_chunked_body_is_cut_off_at_the_limit():
+    with pytest.raises(HTTPException) as rejected:
+        call(RequestSizeLimit(echo_body, max_bytes=10), [], [b"x" * 6, b"x" * 6])
+    assert rejected.value.status_code == 413
@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("cv2")
+
+from app.services import shared_frames
+from app.services.shared_frames import SharedFramePool, attach
+
+
+def frame(value: int) -> np.ndarray:
+    return np.full((4, 4, 3), value, dtype=np.uint8)
+
+
+def test_pools_in_one_process_get_distinct_names():
+    first, second = SharedFramePool(slots=1, slot_bytes=64), SharedFramePool(slots=1, slot_bytes=64)
+    try:
+        with first.lease(frame(1)) as a, second.lease(frame(2)) as b:
+            assert a.name != b.name
+            assert attach(a)[0, 0, 0] == 1
+            assert attach(b)[0, 0, 0] == 2
+    finally:
+        first.close()
+        second.close()
+
+
+def test_attached_segments_are_bounded(monkeypatch):
+    monkeypatch.setattr(shared_frames, "MAX_ATTACHED", 2)
+    pools = [SharedFramePool(slots=1, slot_bytes=64) for _ in range(4)]
+    try:
+        names = []
+        for value, pool in enumerate(pools):
+            with pool.lease(frame(value)) as handle:
+                names.append(handle.name)
+                attach(handle)
+        assert list(shared_frames._attached)[-2:] == names[-2:]
+        assert not set(names[:2]) & set(shared_frames._attached)
+    finally:
+        for pool in pools:
+            pool.close()
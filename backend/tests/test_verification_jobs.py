@@ -0,0 +1,33 @@
+import threading
+
+from app.services.verification_jobs import JOB_BUSY, JOB_DUPLICATE, JOB_SUBMITTED, VerificationJobQueue
+
+
+def test_one_job_per_session_and_bounded_pending():
+    queue = VerificationJobQueue(max_workers=1, max_pending=2)
+    release = threading.Event()
+    try:
+        assert queue.submit("s1", release.wait) == JOB_SUBMITTED
+        assert queue.submit("s1", release.wait) == JOB_DUPLICATE
+        assert queue.submit("s2", release.wait) == JOB_SUBMITTED
+        assert queue.submit("s3", release.wait) == JOB_BUSY
+        assert queue.is_pending("s1")
+    finally:
+        release.set()
+        queue.shutdown()
+    assert queue.metrics()["completed"] == 2
+    assert queue.metrics()["rejected"] == 1
+
+
+def test_fast_job_result_is_not_overwritten_by_pending_marker():
+    """The liveness endpoint marks a session pending before submitting, as here."""
+    queue = VerificationJobQueue(max_workers=1)
+    session = {"verification": None}
+
+    def fail_fast(session):
+        session["verification"] = {"status": "failed", "error": "ID not uploaded"}
+
+    session["verification"] = {"status": "pending"}
+    assert queue.submit("s1", fail_fast, session) == JOB_SUBMITTED
+    queue.shutdown()
+    assert session["verification"]["status"] == "failed"
@@ -24,6 +24,7 @@ export default function LiveFaceVerification() {
     detectHeadTurn,
     captureAndCompare,
     resetVerification,
+    scheduleCaptures,
     isMounted,
     isCapturingBlink,
     isCapturingLeft,
@@ -165,49 +166,25 @@ export default function LiveFaceVerification() {
     }
   }, [blinkDetected, leftPoseDetected, rightPoseDetected]);
 
-  // Blink detection interval
+  // Blink detection loop, paced by the server's capture hints
   useEffect(() => {
-    let interval: NodeJS.Timeout;
     if (idUploaded && currentStep === 'blink' && !blinkDetected && isMounted.current) {
-      interval = setInterval(() => {
-        if (!isCapturingBlink.current && isMounted.current) {
-          detectBlink();
-        }
-      }, 500);
+      return scheduleCaptures(detectBlink);
     }
-    return () => {
-      if (interval) clearInterval(interval);
-    };
   }, [idUploaded, currentStep, blinkDetected]);
 
-  // Left turn detection interval
+  // Left turn detection loop
   useEffect(() => {
-    let interval: NodeJS.Timeout;
     if (idUploaded && currentStep === 'left' && !leftPoseDetected && isMounted.current) {
-      interval = setInterval(() => {
-        if (!isCapturingLeft.current && isMounted.current) {
-          detectHeadTurn('left');
-        }
-      }, 500);
+      return scheduleCaptures(() => detectHeadTurn('left'));
     }
-    return () => {
-      if (interval) clearInterval(interval);
-    };
   }, [idUploaded, currentStep, leftPoseDetected]);
 
-  // Right turn detection interval
+  // Right turn detection loop
   useEffect(() => {
-    let interval: NodeJS.Timeout;
     if (idUploaded && currentStep === 'right' && !rightPoseDetected && isMounted.current) {
-      interval = setInterval(() => {
-        if (!isCapturingRight.current && isMounted.current) {
-          detectHeadTurn('right');
-        }
-      }, 500);
+      return scheduleCaptures(() => detectHeadTurn('right'));
     }
-    return () => {
-      if (interval) clearInterval(interval);
-    };
   }, [idUploaded, currentStep, rightPoseDetected]);
 
   // Face comparison interval (after all liveness checks)
@@ -5,6 +5,26 @@ import * as ImagePicker from 'expo-image-picker';
 
 const ip_url = process.env.EXPO_PUBLIC_IP_URL;
 
+// Capture pace until the server sends a next_interval_ms hint
+const DEFAULT_CAPTURE_INTERVAL_MS = 500;
+
+// Server-computed capture hints returned by the liveness endpoints
+type CaptureHints = {
+    challenge_state: string;
+    next_interval_ms: number | null;
+    target_resolution: { width: number; height: number } | null;
+    jpeg_quality: number;
+    // Pixels of a frame_width x frame_height frame; the -roi endpoints' crop_*/frame_* params
+    crop_region: {
+        x: number;
+        y: number;
+        width: number;
+        height: number;
+        frame_width: number;
+        frame_height: number;
+    } | null;
+};
+
 export const useFaceRecog = () => {
     const cameraRef = useRef<CameraView>(null);
     const [permission, requestPermission] = useCameraPermissions();
@@ -24,12 +44,43 @@ export const useFaceRecog = () => {
     const isCapturingRight = useRef<boolean>(false);
     const isCapturingCompare = useRef<boolean>(false);
     const isMounted = useRef<boolean>(true);
+    const captureHints = useRef<CaptureHints | null>(null);
+    const nextCaptureAt = useRef<number>(0);
     
     const sessionId = useRef(`session-${Date.now()}`).current;
 
     // Computed: liveness fully verified
     const livenessVerified = blinkDetected && leftPoseDetected && rightPoseDetected;
 
+    const applyCaptureHints = (hints?: CaptureHints) => {
+        if (!hints) return;
+        captureHints.current = hints;
+        nextCaptureAt.current = hints.next_interval_ms ? Date.now() + hints.next_interval_ms : 0;
+    };
+
+    // Time left until the capture the server's last hint asked for
+    const captureDelay = () =>
+        nextCaptureAt.current ? Math.max(0, nextCaptureAt.current - Date.now()) : DEFAULT_CAPTURE_INTERVAL_MS;
+
+    // Run capture repeatedly, scheduling each one only after the previous
+    // response so its next_interval_ms sets the pace. Returns a cancel function.
+    const scheduleCaptures = (capture: () => Promise<void>) => {
+        let cancelled = false;
+        let timer: ReturnType<typeof setTimeout>;
+        const next = () => {
+            timer = setTimeout(async () => {
+                if (cancelled || !isMounted.current) return;
+                await capture();
+                if (!cancelled) next();
+            }, captureDelay());
+        };
+        next();
+        return () => {
+            cancelled = true;
+            clearTimeout(timer);
+        };
+    };
+
     const uploadId = async () => {
         try {
             const result = await ImagePicker.launchImageLibraryAsync({
@@ -78,11 +129,15 @@ export const useFaceRecog = () => {
             return;
         }
 
+        if (Date.now() < nextCaptureAt.current) {
+            return;
+        }
+
         isCapturingBlink.current = true;
 
         try {
             const photo = await cameraRef.current.takePictureAsync({
-                quality: 0.5,
+                quality: captureHints.current?.jpeg_quality ?? 0.5,
                 skipProcessing: true,
             });
 
@@ -114,10 +169,17 @@ export const useFaceRecog = () => {
             if (!isMounted.current) return;
 
             const data = response.data;
+            applyCaptureHints(data.capture_hints);
 
             if (data.face_detected && data.blink_detected) {
                 setBlinkDetected(true);
             }
+
+            // A confident passive liveness score makes the head turns unnecessary
+            if (data.head_turns_skipped) {
+                setLeftPoseDetected(true);
+                setRightPoseDetected(true);
+            }
         } catch (err: any) {
             if (isMounted.current) {
                 console.error('Blink Detection Error:', err);
@@ -135,11 +197,15 @@ export const useFaceRecog = () => {
             return;
         }
 
+        if (Date.now() < nextCaptureAt.current) {
+            return;
+        }
+
         isCapturingRef.current = true;
 
         try {
             const photo = await cameraRef.current.takePictureAsync({
-                quality: 0.5,
+                quality: captureHints.current?.jpeg_quality ?? 0.5,
                 skipProcessing: true,
             });
 
@@ -176,6 +242,7 @@ export const useFaceRecog = () => {
             if (!isMounted.current) return;
 
             const data = response.data;
+            applyCaptureHints(data.capture_hints);
 
             if (data.face_detected && data.pose_detected) {
                 if (direction === 'left') {
@@ -305,6 +372,7 @@ export const useFaceRecog = () => {
         detectHeadTurn,
         captureAndCompare,
         resetVerification,
+        scheduleCaptures,
         isMounted,
         isCapturingBlink,
         isCapturingLeft,